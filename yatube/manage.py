@@ -5,7 +5,8 @@ import sys
 
 
 def main():
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'yatube.settings.development')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
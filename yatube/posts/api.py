@@ -0,0 +1,197 @@
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+
+from . import feeds
+from .counters import stats_for
+from .models import Group, User
+
+
+class ApiError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def _error(status, detail):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def api_view(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = _error(405, 'Метод не поддерживается')
+            response['Allow'] = 'GET, HEAD'
+            return response
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return _error(404, 'Не найдено')
+        except ApiError as error:
+            return _error(error.status, error.detail)
+    return wrapper
+
+
+def post_data(post):
+    return {
+        'id': post.id,
+        'text': post.text,
+        'pub_date': post.pub_date,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+        'image_width': post.image_width,
+        'image_height': post.image_height,
+        'comments_count': post.comments_count,
+        'url': reverse('post', args=[post.author.username, post.id]),
+    }
+
+
+def comment_data(comment):
+    return {
+        'id': comment.id,
+        'post': comment.post_id,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created,
+    }
+
+
+def group_data(group):
+    return {
+        'id': group.id,
+        'title': group.title,
+        'slug': group.slug,
+        'description': group.description,
+    }
+
+
+def user_data(user):
+    stats = stats_for(user)
+    return {
+        'username': user.username,
+        'full_name': user.get_full_name(),
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
+        'url': reverse('profile', args=[user.username]),
+    }
+
+
+def _fields(request):
+    requested = request.GET.get('fields', '')
+    return [name.strip() for name in requested.split(',') if name.strip()]
+
+
+def _pick(data, fields):
+    # разреженная выборка полей: ?fields=id,text
+    if not fields:
+        return data
+    unknown = set(fields) - set(data)
+    if unknown:
+        raise ApiError(400, 'Неизвестные поля: ' +
+                       ', '.join(sorted(unknown)))
+    return {name: data[name] for name in fields}
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, 'limit должен быть числом')
+    return min(max(limit, 1), settings.API_MAX_PAGE_SIZE)
+
+
+def _dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def paginated(request, queryset, serializer, ordering=('-pub_date', '-id')):
+    paginator = feeds.paginator(queryset, _limit(request), ordering=ordering)
+    page = paginator.get_page(request.GET.get('cursor'))
+    fields = _fields(request)
+    # ошибку в fields нужно вернуть до начала потока
+    results = (_pick(serializer(item), fields) for item in page)
+    first = next(results, None)
+
+    def link(cursor):
+        if cursor is None:
+            return None
+        query = request.GET.copy()
+        query['cursor'] = cursor
+        return request.path + '?' + query.urlencode()
+
+    def stream():
+        yield '{"results": ['
+        if first is not None:
+            yield _dumps(first)
+        for data in results:
+            yield ',' + _dumps(data)
+        yield '], "next": {}, "previous": {}}}'.format(
+            _dumps(link(page.next_cursor)),
+            _dumps(link(page.previous_cursor)))
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
+
+
+def detail(request, serializer, item):
+    return JsonResponse(_pick(serializer(item), _fields(request)),
+                        json_dumps_params={'ensure_ascii': False})
+
+
+@api_view
+def post_list(request):
+    return paginated(request, feeds.index_feed(), post_data)
+
+
+@api_view
+def post_detail(request, post_id):
+    return detail(request, post_data, feeds.find_post(post_id))
+
+
+@api_view
+def post_comments(request, post_id):
+    post = feeds.find_post(post_id)
+    comments = post.comments.select_related('author')
+    return paginated(request, comments, comment_data,
+                     ordering=('created', 'id'))
+
+
+@api_view
+def group_list(request):
+    return paginated(request, Group.objects.all(), group_data,
+                     ordering=('id',))
+
+
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return paginated(request, feeds.group_feed(group), post_data)
+
+
+@api_view
+def user_detail(request, username):
+    user = get_object_or_404(User.objects.select_related('stats'),
+                             username=username)
+    return detail(request, user_data, user)
+
+
+@api_view
+def user_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    return paginated(request, feeds.profile_tiers(author), post_data)
+
+
+@api_view
+def follow_feed(request):
+    if not request.user.is_authenticated:
+        raise ApiError(401, 'Нужна авторизация')
+    return paginated(request, feeds.follow_feed(request.user), post_data,
+                     ordering=feeds.FOLLOW_ORDERING)
@@ -0,0 +1,17 @@
+from django.urls import path
+
+from . import api
+
+urlpatterns = [
+    path("posts/", api.post_list, name="api_posts"),
+    path("posts/<int:post_id>/", api.post_detail, name="api_post"),
+    path("posts/<int:post_id>/comments/", api.post_comments,
+         name="api_post_comments"),
+    path("groups/", api.group_list, name="api_groups"),
+    path("groups/<slug:slug>/posts/", api.group_posts,
+         name="api_group_posts"),
+    path("users/<str:username>/", api.user_detail, name="api_user"),
+    path("users/<str:username>/posts/", api.user_posts,
+         name="api_user_posts"),
+    path("follow/", api.follow_feed, name="api_follow"),
+]
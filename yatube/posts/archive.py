@@ -0,0 +1,40 @@
+from django.db import transaction
+
+from .models import (ArchivedComment, ArchivedPost, Comment, Post, PostScore,
+                     TimelineEntry)
+
+POST_FIELDS = ['id', 'text', 'pub_date', 'author_id', 'group_id', 'image',
+               'image_width', 'image_height', 'comments_count']
+COMMENT_FIELDS = ['id', 'post_id', 'author_id', 'text', 'created']
+
+
+def candidates(cutoff):
+    return Post.objects.filter(pub_date__lt=cutoff).order_by('pub_date', 'id')
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Переносит в архив до batch_size самых старых постов, опубликованных
+    раньше cutoff, вместе с комментариями. Возвращает число перенесённых
+    постов и комментариев.
+    """
+    with transaction.atomic():
+        posts = list(candidates(cutoff).values(*POST_FIELDS)[:batch_size])
+        if not posts:
+            return 0, 0
+        ids = [post['id'] for post in posts]
+        ArchivedPost.objects.bulk_create(
+            [ArchivedPost(**post) for post in posts])
+        comments = Comment.objects.filter(post_id__in=ids).values(
+            *COMMENT_FIELDS)
+        archived_comments = ArchivedComment.objects.bulk_create(
+            ArchivedComment(**comment) for comment in comments)
+        # удаление без сигналов на каждую строку: пост не исчезает, а
+        # переезжает, поэтому счётчики не меняются, а кэш страниц команда
+        # сбрасывает один раз в конце
+        for queryset in (TimelineEntry.objects.filter(post_id__in=ids),
+                         PostScore.objects.filter(post_id__in=ids),
+                         Comment.objects.filter(post_id__in=ids),
+                         Post.objects.filter(pk__in=ids)):
+            queryset._raw_delete(queryset.db)
+    return len(posts), len(archived_comments)
@@ -0,0 +1,64 @@
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from .models import ArchivedPost, ImageBlob, Post
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+# Счётчики ссылок на файлы картинок (posts.storage). Меняются через F(),
+# как счётчики в posts.counters; файл и его миниатюры удаляются после
+# коммита, когда на него не осталось ссылок.
+
+
+def acquire(name, count=1):
+    """Добавляет ссылки на файл. True – если файл раньше не использовался."""
+    if ImageBlob.objects.filter(name=name).update(refs=F('refs') + count):
+        return False
+    try:
+        with transaction.atomic():
+            ImageBlob.objects.create(name=name, refs=count)
+        return True
+    except IntegrityError:
+        # строку успел создать параллельный запрос
+        ImageBlob.objects.filter(name=name).update(refs=F('refs') + count)
+        return False
+
+
+def release(name):
+    ImageBlob.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1)
+    deleted, _ = ImageBlob.objects.filter(name=name, refs=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: _delete_file(name))
+
+
+def _delete_file(name):
+    if ImageBlob.objects.filter(name=name).exists():
+        # тот же файл успели загрузить снова
+        return
+    try:
+        delete_thumbnails(ImageFile(name, image_storage))
+    except OSError:
+        logger.exception('Не удалось удалить картинку %s', name)
+
+
+def rebuild():
+    """Пересчитывает ссылки по постам и архиву (после bulk_create)."""
+    refs = {}
+    for model in (Post, ArchivedPost):
+        counts = (model.objects.exclude(image='').exclude(image=None)
+                  .values_list('image').annotate(Count('pk')).order_by())
+        for name, count in counts:
+            refs[name] = refs.get(name, 0) + count
+    with transaction.atomic():
+        ImageBlob.objects.all().delete()
+        ImageBlob.objects.bulk_create(
+            (ImageBlob(name=name, refs=count) for name, count in refs.items()),
+            batch_size=500,
+        )
+    return len(refs)
@@ -0,0 +1,41 @@
+import io
+from contextlib import contextmanager
+
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection
+
+from . import blobs, cache, timeline, trending
+from .models import Comment, Post
+
+
+# Массовая запись через bulk_create (команды import_posts, seed_data) идёт
+# мимо сигналов, поэтому производные данные приводятся в порядок отдельно
+
+@contextmanager
+def original_dates():
+    # auto_now_add перезаписал бы заданные даты при bulk_create
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def finish(author_ids):
+    # последовательности id (после вставки с явными id), счётчики, ссылки
+    # на картинки, ленты подписчиков затронутых авторов, рейтинг
+    # популярного и кэш страниц
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(),
+                                                     [Post, Comment]):
+            cursor.execute(sql)
+    call_command('rebuild_counters', stdout=io.StringIO())
+    blobs.rebuild()
+    timeline.refill(author_ids)
+    trending.rebuild()
+    cache.bump(cache.SITE)
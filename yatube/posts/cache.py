@@ -0,0 +1,135 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag, urlencode
+
+from yatube.metrics import record_cache
+
+VERSION_KEY = 'posts:version:{}'
+PAGE_KEY = 'posts:page:{}'
+LOCK_KEY = 'posts:lock:{}'
+
+# общая область для редких изменений, задевающих все страницы сразу
+SITE = 'site'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def get_versions(scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # версию могли вытеснить из кэша: новая заведомо не совпадёт ни с
+        # одной старой, поэтому устаревшие страницы не оживут
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump(*scopes):
+    cache.set_many(
+        {VERSION_KEY.format(scope): _new_version() for scope in scopes},
+        None,
+    )
+
+
+def cached_page(scopes, params=('cursor',)):
+    """
+    Кэширует ответ страницы до изменения данных, а не на фиксированное
+    время: в ключ входят версии областей (scopes), которые сигналы из
+    posts.signals сдвигают при каждой записи. Пока одна копия процесса
+    перестраивает устаревшую страницу, остальные отдают прежнюю.
+
+    Из строки запроса в ключ попадают только параметры params, которые
+    view читает сама: остальные (?utm=…, случайный мусор) не плодят
+    записей в общем кэше.
+
+    Те же версии служат валидатором для условных GET: ETag собирается из
+    версий, пользователя и адреса, поэтому 304 отдаётся до обращения к
+    базе и шаблонам. Пока реплика может не знать о последней записи,
+    страница уходит без валидаторов и с Cache-Control: no-cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = get_versions([SITE, *scopes(*args, **kwargs)])
+            tag = '.'.join(map(str, versions))
+            name = hashlib.md5(':'.join([
+                view.__module__, view.__name__,
+                str(request.user.pk or 0), request.path,
+                urlencode([(param, request.GET[param]) for param in params
+                           if param in request.GET]),
+            ]).encode()).hexdigest()
+            # версии – time.time_ns() последней записи в области
+            last_modified = max(versions) // 10 ** 9
+            etag = quote_etag(hashlib.md5(
+                f'{tag}:{name}'.encode()).hexdigest())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                record_cache('page', 1)
+                return _validated(response, etag, last_modified)
+            entry = cache.get(PAGE_KEY.format(name))
+            if entry is not None and entry[0] == tag:
+                record_cache('page', 1)
+                return entry[1]
+            lock = LOCK_KEY.format(name)
+            locked = cache.add(lock, 1, settings.POSTS_PAGE_LOCK_TIMEOUT)
+            if not locked and entry is not None:
+                record_cache('page', 1)
+                return entry[1]
+            record_cache('page', 0, 1)
+            try:
+                response = view(request, *args, **kwargs)
+                if (response.status_code == 200
+                        and _replica_may_lag(versions)):
+                    # без ETag: иначе браузер получил бы 304 на копию с
+                    # реплики и держал бы её до следующей записи
+                    patch_cache_control(response, no_cache=True)
+                elif response.status_code == 200:
+                    _validated(response, etag, last_modified)
+                    if not response.streaming and not response.cookies:
+                        cache.set(PAGE_KEY.format(name), (tag, response),
+                                  settings.POSTS_PAGE_CACHE_TIMEOUT)
+            finally:
+                if locked:
+                    cache.delete(lock)
+            return response
+        return wrapper
+    return decorator
+
+
+def _replica_may_lag(versions):
+    # страница могла быть прочитана с реплики, ещё не получившей последнюю
+    # запись: под новой версией её не сохраняем, пока не пройдёт окно
+    # REPLICA_PIN_SECONDS (yatube.db_router)
+    if not settings.DATABASE_REPLICAS:
+        return False
+    age = time.time_ns() - max(versions)
+    return age < settings.REPLICA_PIN_SECONDS * 10 ** 9
+
+
+def _validated(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # в странице есть части для конкретного пользователя: ссылка на
+    # редактирование, кнопка подписки
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def post_scopes(post, group_slugs=()):
+    scopes = ['index', f'post:{post.pk}', f'profile:{post.author.username}']
+    scopes += [f'group:{slug}' for slug in group_slugs]
+    return scopes
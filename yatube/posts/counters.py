@@ -0,0 +1,64 @@
+from django.db import IntegrityError
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ArchivedPost, Comment, Follow, Post, User, UserStats
+
+
+def _count(model, field):
+    rows = (model.objects.filter(**{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def real_user_counts():
+    return User.objects.annotate(
+        # архивные посты по-прежнему посты автора
+        real_posts=_count(Post, 'author') + _count(ArchivedPost, 'author'),
+        real_followers=_count(Follow, 'author'),
+        real_following=_count(Follow, 'user'),
+    )
+
+
+def real_post_counts():
+    return Post.objects.annotate(real_comments=_count(Comment, 'post'))
+
+
+def stats_for(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return rebuild_user(user.pk)
+
+
+def rebuild_user(user_id):
+    real = real_user_counts().get(pk=user_id)
+    try:
+        stats, _ = UserStats.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                'posts_count': real.real_posts,
+                'followers_count': real.real_followers,
+                'following_count': real.real_following,
+            },
+        )
+    except IntegrityError:
+        # параллельный запрос успел создать строку первым
+        stats = UserStats.objects.get(user_id=user_id)
+    return stats
+
+
+def bump_user(user_id, **deltas):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{name: Greatest(F(name) + delta, 0)
+           for name, delta in deltas.items()})
+    # строки может не быть у пользователей из фикстур: при росте счётчика
+    # пересчитываем её целиком, при уменьшении расхождение поправит
+    # команда rebuild_counters (пользователь может как раз удаляться)
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        rebuild_user(user_id)
+
+
+def bump_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Greatest(F('comments_count') + delta, 0))
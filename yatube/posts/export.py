@@ -0,0 +1,127 @@
+import itertools
+import json
+import logging
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import feeds
+from .api import comment_data, post_data
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+MEDIA_DIR = 'media/'
+
+
+class _Pipe:
+    """
+    Файл только для записи, из которого генератор забирает готовые байты.
+    tell() у него нет, поэтому zipfile пишет архив потоком, с дескрипторами
+    данных после каждого файла, и ничего не перематывает.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _entry(name, compress_type=zipfile.ZIP_DEFLATED):
+    info = zipfile.ZipInfo(name, time.localtime()[:6])
+    info.compress_type = compress_type
+    return info
+
+
+def _export_post(post):
+    data = post_data(post)
+    data['image_file'] = MEDIA_DIR + post.image.name if post.image else None
+    data['archived'] = getattr(post, 'is_archived', False)
+    return data
+
+
+def _json_list(archive, pipe, name, items, serializer):
+    with archive.open(_entry(name), 'w', force_zip64=True) as entry:
+        entry.write(b'[')
+        for number, item in enumerate(items):
+            if number:
+                entry.write(b',')
+            entry.write(b'\n' + json.dumps(
+                serializer(item), cls=DjangoJSONEncoder,
+                ensure_ascii=False).encode())
+            yield pipe.drain()
+        entry.write(b'\n]\n')
+    yield pipe.drain()
+
+
+def _media_file(archive, pipe, name):
+    try:
+        source = image_storage.open(name, 'rb')
+    except OSError:
+        logger.warning('Нет файла %s для выгрузки', name)
+        return
+    # картинки уже сжаты, повторно их не жмём
+    with source, archive.open(_entry(MEDIA_DIR + name, zipfile.ZIP_STORED),
+                              'w', force_zip64=True) as entry:
+        for block in source.chunks():
+            entry.write(block)
+            yield pipe.drain()
+    yield pipe.drain()
+
+
+def stream(user):
+    """
+    Отдаёт zip со всеми постами, комментариями и картинками пользователя
+    по кускам. Записи читаются через .iterator(), так что память не
+    зависит от их числа.
+    """
+    return (chunk for chunk in _archive(user) if chunk)
+
+
+def _archive(user):
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w') as archive:
+        # старые посты и комментарии к ним лежат в архиве (posts.archive):
+        # сначала они, потом живые, в каждой части – по дате
+        posts = itertools.chain(
+            feeds.archived_profile_feed(user).order_by('pub_date', 'id')
+            .iterator(chunk_size),
+            feeds.profile_feed(user).order_by('pub_date', 'id')
+            .iterator(chunk_size),
+        )
+        yield from _json_list(archive, pipe, 'posts.json', posts,
+                              _export_post)
+        comments = itertools.chain(
+            user.archived_comments.select_related('author')
+            .order_by('created', 'id').iterator(chunk_size),
+            user.comments.select_related('author')
+            .order_by('created', 'id').iterator(chunk_size),
+        )
+        yield from _json_list(archive, pipe, 'comments.json', comments,
+                              comment_data)
+        # UNION убирает картинки, общие для нескольких постов
+        images = (user.posts.exclude(image='').exclude(image=None)
+                  .order_by().values_list('image', flat=True)
+                  .union(user.archived_posts.exclude(image='')
+                         .exclude(image=None).order_by()
+                         .values_list('image', flat=True))
+                  .order_by('image'))
+        for name in images.iterator(chunk_size):
+            yield from _media_file(archive, pipe, name)
+    yield pipe.drain()
+
+
+def filename(user):
+    return f'yatube-{user.username}.zip'
@@ -0,0 +1,65 @@
+from django.shortcuts import get_object_or_404
+
+from .models import ArchivedPost, Post
+from .paginator import CursorPaginator, TieredCursorPaginator
+from . import timeline
+
+
+# Общие queryset'ы лент: автор и группа подтягиваются тем же запросом, а
+# число комментариев хранится в Post.comments_count, поэтому страница из N
+# карточек стоит фиксированное число запросов
+def feed(posts=None):
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.select_related('author', 'group')
+
+
+def index_feed():
+    return feed()
+
+
+def group_feed(group):
+    return feed(group.posts.all())
+
+
+def profile_feed(author):
+    return feed(author.posts.all())
+
+
+def archived_feed(posts=None):
+    if posts is None:
+        posts = ArchivedPost.objects.all()
+    return posts.select_related('author', 'group')
+
+
+def archived_profile_feed(author):
+    return archived_feed(author.archived_posts.all())
+
+
+def profile_tiers(author):
+    # старые посты листаются дальше из архива
+    return [profile_feed(author), archived_profile_feed(author)]
+
+
+def find_post(post_id, **filters):
+    """Пост из горячей таблицы или из архива (страница поста, API)."""
+    post = feed().filter(pk=post_id, **filters).first()
+    if post is None:
+        post = get_object_or_404(archived_feed(), pk=post_id, **filters)
+    return post
+
+
+FOLLOW_ORDERING = timeline.ORDERING
+
+
+def follow_feed(user, celebrities=None):
+    # список ярусов для TieredCursorPaginator (см. timeline_tiers)
+    return [feed(posts)
+            for posts in timeline.timeline_tiers(user, celebrities)]
+
+
+def paginator(posts, per_page, ordering=('-pub_date', '-id')):
+    """Курсор по ленте: по одному запросу или по списку ярусов."""
+    if isinstance(posts, list):
+        return TieredCursorPaginator(posts, per_page, ordering)
+    return CursorPaginator(posts, per_page, ordering)
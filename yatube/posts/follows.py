@@ -0,0 +1,41 @@
+from django.db import connections, router
+from django.db.models.signals import post_save
+
+from .models import Follow
+
+# Подписка и отписка без предварительных проверок: вставка с пропуском
+# дубликата и удаление по фильтру. Сигналы (счётчики, ленты, кэш страниц)
+# приходят, только если строка действительно появилась или исчезла,
+# поэтому повторный клик ничего не меняет.
+
+
+def follow(user, author):
+    """Подписывает user на author. True – если подписки раньше не было."""
+    using = router.db_for_write(Follow)
+    connection = connections[using]
+    ops = connection.ops
+    columns = ', '.join(ops.quote_name(Follow._meta.get_field(name).column)
+                        for name in ('user', 'author'))
+    sql = ' '.join(filter(None, [
+        ops.insert_statement(ignore_conflicts=True),
+        ops.quote_name(Follow._meta.db_table),
+        f'({columns}) VALUES (%s, %s)',
+        ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+    ]))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk, author.pk])
+        created = cursor.rowcount == 1
+    # INSERT мимо save(): post_save отправляем сами
+    if created:
+        post_save.send(sender=Follow, instance=Follow(user=user,
+                                                      author=author),
+                       created=True, update_fields=None, raw=False,
+                       using=using)
+    return created
+
+
+def unfollow(user, author):
+    """Отписывает user от author. True – если подписка была."""
+    # delete() сам отправит post_delete для каждой удалённой строки
+    deleted, _ = Follow.objects.filter(user=user, author=author).delete()
+    return bool(deleted)
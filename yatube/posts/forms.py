@@ -1,4 +1,6 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
+from .images import normalize
 from .models import Post, Comment
 
 
@@ -17,6 +19,13 @@ class PostForm(ModelForm):
             'image': 'Картинка к посту',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # новая загрузка, а не уже сохранённый файл поста
+        if isinstance(image, UploadedFile):
+            return normalize(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,79 @@
+import io
+import os
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from sorl.thumbnail import get_thumbnail
+
+
+def webp_supported():
+    Image.init()
+    return 'WEBP' in Image.SAVE
+
+
+def normalize(upload):
+    """
+    Готовит загруженную картинку к хранению: поворачивает по EXIF,
+    уменьшает до POSTS_IMAGE_MAX_SIZE и пересохраняет прогрессивным JPEG
+    без метаданных.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.split()[-1])
+    max_size = settings.POSTS_IMAGE_MAX_SIZE
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=settings.POSTS_IMAGE_QUALITY,
+               optimize=True, progressive=True)
+    name = os.path.splitext(os.path.basename(upload.name))[0] + '.jpg'
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+def card_formats():
+    formats = ['JPEG']
+    if webp_supported():
+        formats.append('WEBP')
+    return formats
+
+
+def card_sizes(width=None):
+    # основная геометрия карточки есть всегда; большие – только если
+    # исходник не меньше, чтобы не раздувать картинку апскейлом
+    base = settings.POSTS_CARD_IMAGE_SIZES[settings.POSTS_CARD_IMAGE_BASE]
+    sizes = []
+    for size in settings.POSTS_CARD_IMAGE_SIZES:
+        size_width = int(size.split('x')[0])
+        if size == base or width is None or size_width <= width:
+            sizes.append(size)
+    return sizes
+
+
+def thumbnail_variants(width=None):
+    options = settings.POSTS_CARD_IMAGE_OPTIONS
+    return [
+        (size, dict(options, format=image_format))
+        for image_format in card_formats()
+        for size in card_sizes(width)
+    ]
+
+
+def card_image(image, width=None):
+    base = settings.POSTS_CARD_IMAGE_SIZES[settings.POSTS_CARD_IMAGE_BASE]
+    srcsets = {}
+    src = None
+    for size, options in thumbnail_variants(width):
+        thumbnail = get_thumbnail(image, size, **options)
+        srcsets.setdefault(options['format'], []).append(
+            f'{thumbnail.url} {size.split("x")[0]}w')
+        if size == base and options['format'] == 'JPEG':
+            src = thumbnail
+    return {
+        'src': src,
+        'srcset': ', '.join(srcsets.get('JPEG', [])),
+        'webp_srcset': ', '.join(srcsets.get('WEBP', [])),
+    }
@@ -0,0 +1,47 @@
+import datetime as dt
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import archive, cache
+
+
+class Command(BaseCommand):
+    help = ('Переносит посты старше заданного возраста вместе с '
+            'комментариями в архивные таблицы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.POSTS_ARCHIVE_AFTER_DAYS,
+                            help='возраст поста в днях')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.POSTS_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только посчитать посты для архива')
+
+    def handle(self, *args, days, batch_size, dry_run, **options):
+        cutoff = timezone.now() - dt.timedelta(days=days)
+        if dry_run:
+            self.stdout.write(
+                f'Постов для архива: {archive.candidates(cutoff).count()}')
+            return
+        started = time.monotonic()
+        posts = comments = 0
+        while True:
+            # каждая пачка – своя короткая транзакция
+            moved, moved_comments = archive.archive_batch(cutoff,
+                                                          batch_size)
+            if not moved:
+                break
+            posts += moved
+            comments += moved_comments
+            self.stdout.write(f'{posts} постов, {comments} комментариев')
+        if posts:
+            # из лент, групп и профилей пропали посты
+            cache.bump(cache.SITE)
+        self.stdout.write(self.style.SUCCESS(
+            f'В архив: постов – {posts}, комментариев – {comments}, '
+            f'{time.monotonic() - started:.1f} с'
+        ))
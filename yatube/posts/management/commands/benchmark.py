@@ -0,0 +1,213 @@
+import io
+import json
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Follow, Group, Post, User
+
+VIEWS = ('index', 'group_posts', 'profile', 'post_view', 'follow_index',
+         'add_comment')
+
+
+def percentile(values, share):
+    # ближайший ранг по отсортированной выборке
+    index = max(0, min(len(values) - 1,
+                       round(share * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон основных страниц через WSGI-приложение: '
+            'задержки p50/p95/p99, пропускная способность и число '
+            'запросов к базе на страницу, результат – в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--views', nargs='+', choices=VIEWS,
+                            default=list(VIEWS))
+        parser.add_argument('--requests', type=int, default=200,
+                            help='запросов на каждую страницу')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='потоков; 1 – всё в текущем потоке')
+        parser.add_argument('--sessions', type=int, default=20,
+                            help='сколько пользователей залогинить')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='файл для результатов в JSON')
+        parser.add_argument('--ratelimit', action='store_true',
+                            help='не отключать RATELIMITS: все запросы '
+                                 'прогона идут с одного адреса')
+
+    def handle(self, *args, ratelimit, **options):
+        if ratelimit:
+            return self.benchmark(**options)
+        with override_settings(RATELIMITS={}):
+            return self.benchmark(**options)
+
+    def benchmark(self, views, requests, concurrency, sessions, seed,
+                  output, **options):
+        from yatube.wsgi import application
+
+        self.application = application
+        self.rng = random.Random(seed)
+        self.load_targets(sessions)
+        started = timezone.now()
+        results = {}
+        try:
+            for view in views:
+                jobs = [getattr(self, f'request_{view}')()
+                        for _ in range(requests)]
+                results[view] = self.run(jobs, concurrency)
+                self.stdout.write(self.format_result(view, results[view]))
+        finally:
+            for session in self.sessions:
+                session.delete()
+
+        report = {
+            'started': started.isoformat(),
+            'options': {'requests': requests, 'concurrency': concurrency,
+                        'seed': seed, 'database': connection.vendor,
+                        'cache': settings.CACHES['default']['BACKEND']},
+            'views': results,
+        }
+        if output:
+            with open(output, 'w') as target:
+                json.dump(report, target, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты: {output}'))
+
+    def load_targets(self, sessions):
+        self.groups = list(Group.objects.values_list('slug', flat=True))
+        self.authors = list(User.objects.filter(
+            stats__posts_count__gt=0).values_list('username', flat=True))
+        self.posts = list(Post.objects.values_list('author__username', 'id')
+                          .order_by('?')[:1000])
+        readers = list(User.objects.filter(
+            pk__in=Follow.objects.values('user'))[:sessions])
+        if not self.posts or not readers:
+            raise CommandError('Нет данных: сначала запустите seed_data')
+        self.sessions = []
+        self.cookies = []
+        for user in readers:
+            session = import_module(settings.SESSION_ENGINE).SessionStore()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.save()
+            self.sessions.append(session)
+            request = HttpRequest()
+            token = get_token(request)
+            self.cookies.append((
+                f'{settings.SESSION_COOKIE_NAME}={session.session_key}; '
+                f'{settings.CSRF_COOKIE_NAME}={request.META["CSRF_COOKIE"]}',
+                token,
+            ))
+
+    # каждая страница – случайная цель, как у живых посетителей
+
+    def request_index(self):
+        return 'GET', reverse('index'), None, None
+
+    def request_group_posts(self):
+        if not self.groups:
+            raise CommandError('Нет групп')
+        return ('GET', reverse('group', args=[self.rng.choice(self.groups)]),
+                None, None)
+
+    def request_profile(self):
+        return ('GET', reverse('profile', args=[self.rng.choice(
+            self.authors)]), None, None)
+
+    def request_post_view(self):
+        return ('GET', reverse('post', args=self.rng.choice(self.posts)),
+                None, None)
+
+    def request_follow_index(self):
+        cookie, _ = self.rng.choice(self.cookies)
+        return 'GET', reverse('follow_index'), cookie, None
+
+    def request_add_comment(self):
+        cookie, token = self.rng.choice(self.cookies)
+        body = urlencode({'text': 'нагрузочный комментарий',
+                          'csrfmiddlewaretoken': token})
+        return ('POST', reverse('add_comment', args=self.rng.choice(
+            self.posts)), cookie, body)
+
+    def call(self, job):
+        method, url, cookie, body = job
+        body = (body or '').encode()
+        url = urlsplit(url)
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'HTTP_HOST': 'localhost',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if cookie:
+            environ['HTTP_COOKIE'] = cookie
+        status = []
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = self.application(
+                environ, lambda code, headers: status.append(code))
+            try:
+                for _ in result:
+                    pass
+            finally:
+                result.close()
+            elapsed = time.perf_counter() - started
+        return int(status[0].split()[0]), elapsed, len(queries)
+
+    def run(self, jobs, concurrency):
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(concurrency) as pool:
+                samples = list(pool.map(self.call, jobs))
+        else:
+            samples = [self.call(job) for job in jobs]
+        wall = time.perf_counter() - started
+        latencies = sorted(elapsed * 1000 for _, elapsed, _ in samples)
+        queries = [count for *_, count in samples]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for status, *_ in samples if status >= 400),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'mean_ms': round(statistics.mean(latencies), 2),
+            'rps': round(len(samples) / wall, 1) if wall else None,
+            'queries_mean': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    @staticmethod
+    def format_result(view, result):
+        return (f'{view:<14} p50 {result["p50_ms"]:>8} мс  '
+                f'p95 {result["p95_ms"]:>8} мс  p99 {result["p99_ms"]:>8} мс  '
+                f'{result["rps"]} запр/с  запросов к БД: '
+                f'{result["queries_mean"]} (макс. {result["queries_max"]})  '
+                f'ошибок: {result["errors"]}')
@@ -0,0 +1,94 @@
+import re
+import types
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts import feeds
+from posts.models import Comment, Follow, Group, User
+from posts.paginator import CursorPaginator
+
+# признаки плана без подходящего индекса для разных СУБД
+BAD_PLANS = {
+    'sqlite': [
+        re.compile(r'\bSCAN (TABLE )?\w+( AS \w+)?$'),
+        re.compile(r'USE TEMP B-TREE'),
+    ],
+    'postgresql': [
+        re.compile(r'Seq Scan'),
+        re.compile(r'^\s*(->\s*)?Sort\b'),
+    ],
+}
+
+# лента подписок должна идти от записей ленты и индекса автора: обход
+# всех постов по дате (пусть и по индексу) – это OR со знаменитостями
+FOLLOW_BAD_PLANS = {
+    'sqlite': [re.compile(r'\bSCAN (TABLE )?posts_post\b')],
+    'postgresql': [re.compile(r'Index Scan( Backward)? using '
+                              r'post_pub_date_idx')],
+}
+
+
+class Command(BaseCommand):
+    help = ('Проверяет планы запросов лент через EXPLAIN и падает, если '
+            'какой-то из них читает таблицу целиком или сортирует на лету')
+
+    def handle(self, *args, **options):
+        patterns = BAD_PLANS.get(connection.vendor)
+        if patterns is None:
+            raise CommandError(f'Нет правил для СУБД {connection.vendor}')
+        failed = []
+        follow_patterns = patterns + FOLLOW_BAD_PLANS[connection.vendor]
+        for name, queryset in self.querysets():
+            plan = queryset.explain()
+            rules = (follow_patterns if name.startswith('follow_index')
+                     else patterns)
+            bad = [line for line in plan.splitlines()
+                   if any(pattern.search(line) for pattern in rules)]
+            if bad:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: FAIL'))
+            else:
+                self.stdout.write(f'{name}: OK')
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+        if failed:
+            raise CommandError('Запросы без индекса: ' + ', '.join(failed))
+
+    def querysets(self):
+        # сами объекты не нужны – только их ключи для построения запросов
+        user, group = User(pk=1), Group(pk=1)
+        now = timezone.now()
+        row = types.SimpleNamespace(pub_date=now, id=1, created=now,
+                                    feed_date=now, feed_id=1)
+        paginators = {
+            'index': CursorPaginator(feeds.index_feed(), 10),
+            'group': CursorPaginator(feeds.group_feed(group), 10),
+            'profile': CursorPaginator(feeds.profile_feed(user), 10),
+            'profile_archive': CursorPaginator(
+                feeds.archived_profile_feed(user), 10),
+            'comments': CursorPaginator(
+                Comment.objects.filter(post_id=1).select_related('author'),
+                10, ordering=('created', 'id')),
+        }
+        # лента подписок – несколько ярусов, у каждого свой запрос; второй
+        # вариант – пользователь подписан на автора с числом подписчиков
+        # больше TIMELINE_FANOUT_LIMIT
+        follow_feeds = {
+            'follow_index': feeds.follow_feed(user),
+            'follow_index_celebrity': feeds.follow_feed(
+                user, celebrities=[2]),
+        }
+        for feed_name, tiers in follow_feeds.items():
+            for number, tier in enumerate(tiers):
+                paginators[f'{feed_name}[{number}]'] = CursorPaginator(
+                    tier, 10, ordering=feeds.FOLLOW_ORDERING)
+        for name, paginator in paginators.items():
+            yield name, paginator.page_queryset()
+            for direction in (paginator.NEXT, paginator.PREVIOUS):
+                cursor = paginator.encode_cursor(direction, row)
+                yield (f'{name} ({direction})',
+                       paginator.page_queryset(cursor))
+        yield 'followers', Follow.objects.filter(author=user)
+        yield 'is_following', Follow.objects.filter(user=user, author=user)
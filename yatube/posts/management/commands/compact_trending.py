@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из таблицы рейтинга посты, чей вес затух ниже '
+            'TRENDING_MIN_WEIGHT')
+
+    def handle(self, *args, **options):
+        deleted = trending.compact()
+        self.stdout.write(self.style.SUCCESS(f'Удалено рейтингов: {deleted}'))
@@ -0,0 +1,45 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from posts import blobs, cache
+from posts.models import ArchivedPost, ImageBlob, Post
+from posts.storage import image_storage
+
+# имя, которое дал файлу posts.storage
+HASHED = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}\.\w+$')
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки, сохранённые под исходными именами, в '
+            'хранилище по хэшу содержимого и удаляет дубликаты')
+
+    def handle(self, *args, **options):
+        moved = 0
+        legacy = [name for name in
+                  ImageBlob.objects.values_list('name', flat=True)
+                  if not HASHED.search(name)]
+        for name in legacy:
+            if not image_storage.exists(name):
+                self.stderr.write(f'{name}: файла нет')
+                continue
+            with image_storage.open(name, 'rb') as source:
+                hashed = image_storage.save(name, source)
+            with transaction.atomic():
+                refs = 0
+                for model in (Post, ArchivedPost):
+                    refs += model.objects.filter(image=name).update(
+                        image=hashed)
+                ImageBlob.objects.filter(name=name).delete()
+                if refs:
+                    blobs.acquire(hashed, refs)
+            delete_thumbnails(ImageFile(name, image_storage))
+            moved += 1
+        if moved:
+            # в карточках поменялись адреса картинок
+            cache.bump(cache.SITE)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено картинок: {moved} из {len(legacy)}'))
@@ -0,0 +1,31 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты, комментарии и картинки пользователя в zip'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output',
+                            help='файл архива; по умолчанию yatube-<имя>.zip')
+
+    def handle(self, username, output, **options):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {username}')
+        output = output or export.filename(user)
+        started = time.monotonic()
+        with open(output, 'wb') as target:
+            for chunk in export.stream(user):
+                target.write(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f'{output}: {os.path.getsize(output)} байт за '
+            f'{time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,308 @@
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import bulk
+from posts.images import normalize
+from posts.storage import image_storage
+from posts.models import (Comment, Follow, Group, ImportCheckpoint, Post,
+                          User)
+
+KINDS = ('posts', 'comments', 'follows')
+
+
+# ошибки в данных одной записи: она пропускается, импорт идёт дальше
+BAD_RECORD = (KeyError, TypeError, ValueError)
+
+
+def read_records(path):
+    """
+    JSONL или CSV с заголовком – по расширению файла. Строка JSONL,
+    которая не разбирается, отдаётся как None: номера записей не сдвигаются.
+    """
+    with open(path, encoding='utf-8', newline='') as source:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+
+
+def chunks(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def required(record, name):
+    value = record[name]
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f'пустое поле {name}')
+    return value
+
+
+def optional_id(value):
+    return int(value) if value else None
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'не дата: {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return date
+
+
+def copy_image(media_dir, name):
+    # картинки проходят ту же нормализацию, что и загрузки через форму
+    with open(os.path.join(media_dir, name), 'rb') as source:
+        content = normalize(File(source, name=name))
+    with Image.open(content) as image:
+        width, height = image.size
+    content.seek(0)
+    saved = image_storage.save('posts/' + content.name, content)
+    return saved, width, height
+
+
+class Command(BaseCommand):
+    help = ('Потоковый импорт постов, комментариев и подписок из JSONL/CSV '
+            'пачками через bulk_create')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=KINDS)
+        parser.add_argument('path', help='файл .jsonl или .csv')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--media-dir', default='',
+            help='каталог, относительно которого заданы поля image',
+        )
+        parser.add_argument('--workers', type=int, default=8,
+                            help='потоков для копирования картинок')
+        parser.add_argument(
+            '--checkpoint',
+            help='имя отметки о загруженных записях в базе '
+                 '(ImportCheckpoint); по умолчанию – полный путь файла',
+        )
+
+    def handle(self, kind, path, batch_size, media_dir, workers, checkpoint,
+               **options):
+        if not os.path.exists(path):
+            raise CommandError(f'Нет файла {path}')
+        self.media_dir = media_dir
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.groups = dict(Group.objects.values_list('slug', 'id'))
+        self.authors = set()
+        checkpoint = checkpoint or os.path.abspath(path)
+        done = self.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Продолжаем с записи {done}')
+
+        records = read_records(path)
+        for record in itertools.islice(records, done):
+            # авторы уже загруженных пачек тоже нужны для лент в конце
+            if kind != 'comments' and isinstance(record, dict):
+                self.authors.add(record.get('author'))
+        imported = skipped = bad = 0
+        started = time.monotonic()
+        parser = getattr(self, f'parse_{kind}')
+        importer = getattr(self, f'import_{kind}')
+        with ThreadPoolExecutor(workers) as self.pool, bulk.original_dates():
+            for chunk in chunks(records, batch_size):
+                rows = self.parse(parser, chunk, done)
+                if kind == 'posts':
+                    # файлы копируются до транзакции, чтобы не держать её
+                    self.copy_images(rows)
+                # пачка и отметка о ней – в одной транзакции: после сбоя
+                # пачка повторится полностью или не повторится
+                with transaction.atomic():
+                    created = importer(rows)
+                    done += len(chunk)
+                    self.write_checkpoint(checkpoint, done)
+                imported += created
+                skipped += len(rows) - created
+                bad += len(chunk) - len(rows)
+                rate = imported / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f'{done} записей, {rate:.0f} строк/с')
+
+        # bulk_create не отправляет сигналы
+        self.finish()
+        ImportCheckpoint.objects.filter(name=checkpoint).delete()
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано: {imported}, пропущено: {skipped}, '
+            f'с ошибками: {bad}, {elapsed:.1f} с ({rate:.0f} строк/с)'
+        ))
+
+    def parse(self, parser, chunk, offset):
+        rows = []
+        for number, record in enumerate(chunk, offset + 1):
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError('не разобрана строка или не объект')
+                rows.append(parser(record))
+            except BAD_RECORD as error:
+                self.stderr.write(f'Запись {number} пропущена: {error!r}')
+        return rows
+
+    @staticmethod
+    def parse_posts(record):
+        return {
+            'id': optional_id(record.get('id')),
+            'text': required(record, 'text'),
+            'pub_date': parse_date(record.get('pub_date')),
+            'author': required(record, 'author'),
+            'group': record.get('group') or None,
+            'image': record.get('image') or None,
+        }
+
+    @staticmethod
+    def parse_comments(record):
+        return {
+            'id': optional_id(record.get('id')),
+            'post': int(record['post']),
+            'author': required(record, 'author'),
+            'text': required(record, 'text'),
+            'created': parse_date(record.get('created')),
+        }
+
+    @staticmethod
+    def parse_follows(record):
+        return {'user': required(record, 'user'),
+                'author': required(record, 'author')}
+
+    @staticmethod
+    def read_checkpoint(checkpoint):
+        row = ImportCheckpoint.objects.filter(name=checkpoint).first()
+        return row.done if row else 0
+
+    @staticmethod
+    def write_checkpoint(checkpoint, done):
+        ImportCheckpoint.objects.update_or_create(
+            name=checkpoint, defaults={'done': done})
+
+    def user_ids(self, usernames):
+        # незнакомых авторов заводим без пароля, одним запросом на пачку
+        missing = {name for name in usernames if name not in self.users}
+        if missing:
+            User.objects.bulk_create(
+                [User(username=name, password=make_password(None))
+                 for name in missing],
+                ignore_conflicts=True,
+            )
+            self.users.update(User.objects.filter(
+                username__in=missing).values_list('username', 'id'))
+        return self.users
+
+    def group_id(self, slug):
+        if not slug:
+            return None
+        if slug not in self.groups:
+            group, _ = Group.objects.get_or_create(
+                slug=slug, defaults={'title': slug, 'description': ''})
+            self.groups[slug] = group.id
+        return self.groups[slug]
+
+    def copy_images(self, chunk):
+        names = {record['image'] for record in chunk if record.get('image')}
+        futures = {name: self.pool.submit(copy_image, self.media_dir, name)
+                   for name in names}
+        images = {}
+        for name, future in futures.items():
+            try:
+                images[name] = future.result()
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'{name}: {error}')
+        for record in chunk:
+            record['stored_image'] = images.get(record.get('image'),
+                                                (None, None, None))
+
+    @staticmethod
+    def insert(model, objects, keyed, conflicting):
+        # bulk_create молча пропускает дубликаты, поэтому вставленные строки
+        # считаются по приросту keyed – строк с ключами из пачки; только
+        # conflicting объектов (с заданным ключом) могут совпасть с уже
+        # загруженными, остальные вставляются всегда
+        before = keyed.count() if conflicting else 0
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        after = keyed.count() if conflicting else 0
+        return len(objects) - conflicting + after - before
+
+    def import_posts(self, chunk):
+        users = self.user_ids(record['author'] for record in chunk)
+        posts = []
+        for record in chunk:
+            image, width, height = record['stored_image']
+            posts.append(Post(
+                id=record['id'],
+                text=record['text'],
+                pub_date=record['pub_date'],
+                author_id=users[record['author']],
+                group_id=self.group_id(record['group']),
+                image=image,
+                image_width=width,
+                image_height=height,
+            ))
+            self.authors.add(record['author'])
+        ids = [post.id for post in posts if post.id]
+        return self.insert(Post, posts, Post.objects.filter(pk__in=ids),
+                           len(ids))
+
+    def import_comments(self, chunk):
+        users = self.user_ids(record['author'] for record in chunk)
+        post_ids = set(Post.objects.filter(
+            pk__in={record['post'] for record in chunk},
+        ).values_list('id', flat=True))
+        comments = [
+            Comment(
+                id=record['id'],
+                post_id=record['post'],
+                author_id=users[record['author']],
+                text=record['text'],
+                created=record['created'],
+            )
+            for record in chunk if record['post'] in post_ids
+        ]
+        ids = [comment.id for comment in comments if comment.id]
+        return self.insert(Comment, comments,
+                           Comment.objects.filter(pk__in=ids), len(ids))
+
+    def import_follows(self, chunk):
+        users = self.user_ids(itertools.chain.from_iterable(
+            (record['user'], record['author']) for record in chunk))
+        follows = [
+            Follow(user_id=users[record['user']],
+                   author_id=users[record['author']])
+            for record in chunk if record['user'] != record['author']
+        ]
+        created = self.insert(Follow, follows, Follow.objects.filter(
+            user_id__in={follow.user_id for follow in follows},
+            author_id__in={follow.author_id for follow in follows},
+        ), len(follows))
+        self.authors.update(record['author'] for record in chunk)
+        return created
+
+    def finish(self):
+        bulk.finish({self.users[name] for name in self.authors
+                     if name in self.users})
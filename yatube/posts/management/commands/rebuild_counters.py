@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from posts.counters import real_post_counts, real_user_counts
+from posts.models import Post, UserStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, подписок и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только показать расхождения, ничего не исправляя',
+        )
+
+    def handle(self, *args, dry_run=False, **options):
+        with transaction.atomic():
+            users = self.rebuild_users(dry_run)
+            posts = self.rebuild_posts(dry_run)
+        action = 'найдено' if dry_run else 'исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Расхождений {action}: пользователи – {users}, посты – {posts}'
+        ))
+
+    def rebuild_users(self, dry_run):
+        drift = 0
+        for user in real_user_counts().select_related('stats').iterator():
+            real = {
+                'posts_count': user.real_posts,
+                'followers_count': user.real_followers,
+                'following_count': user.real_following,
+            }
+            stats = getattr(user, 'stats', None)
+            stored = {name: getattr(stats, name, None) for name in real}
+            if stored == real:
+                continue
+            drift += 1
+            self.stdout.write(f'{user.username}: {stored} -> {real}')
+            if not dry_run:
+                UserStats.objects.update_or_create(user=user, defaults=real)
+        return drift
+
+    def rebuild_posts(self, dry_run):
+        drift = 0
+        posts = real_post_counts().filter(
+            ~Q(comments_count=F('real_comments')))
+        for post in posts.values('id', 'comments_count', 'real_comments'):
+            drift += 1
+            self.stdout.write(
+                f'post {post["id"]}: {post["comments_count"]} -> '
+                f'{post["real_comments"]}'
+            )
+            if not dry_run:
+                Post.objects.filter(pk=post['id']).update(
+                    comments_count=post['real_comments'])
+        return drift
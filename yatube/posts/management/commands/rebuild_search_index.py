@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс ({connection.vendor}) перестроен за '
+            f'{time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import cache, trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярного по датам публикации '
+            'и комментариев')
+
+    def handle(self, *args, **options):
+        rows = trending.rebuild()
+        cache.bump(cache.SITE)
+        self.stdout.write(self.style.SUCCESS(f'Рейтингов: {rows}'))
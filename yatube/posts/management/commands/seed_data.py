@@ -0,0 +1,212 @@
+import datetime as dt
+import io
+import itertools
+import random
+import time
+
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from posts import bulk
+from posts.models import Comment, Follow, Group, Post, User
+from posts.storage import image_storage
+
+WORDS = (
+    'утро вечер город река лес дом кот собака книга музыка кино поезд '
+    'море горы дорога друг работа отпуск кофе чай дождь снег солнце '
+    'лето зима весна осень фото прогулка парк сад ужин завтрак новости '
+    'проект код релиз тест идея план мечта история встреча праздник'
+).split()
+IMAGE_COUNT = 8
+IMAGE_SIZE = (1200, 800)
+
+
+def zipf_weights(count, alpha):
+    # вес i-го по популярности ~ 1 / i^alpha: немногие авторы собирают
+    # большую часть подписок, постов и комментариев
+    return list(itertools.accumulate(
+        1 / (rank ** alpha) for rank in range(1, count + 1)))
+
+
+def sentence(rng, low=5, high=60):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def batched(items, size):
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими данными: пользователи, подписки '
+            'по степенному закону, посты с картинками и без, комментарии')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='подписок на пользователя в среднем')
+        parser.add_argument('--image-ratio', type=float, default=0.2)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='показатель степенного распределения')
+        parser.add_argument('--days', type=int, default=365,
+                            help='за сколько дней разбросать даты')
+        parser.add_argument('--prefix', default='seed',
+                            help='префикс имён пользователей и групп')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        started = time.monotonic()
+        with bulk.original_dates():
+            users = self.seed_users()
+            groups = self.seed_groups()
+            self.seed_follows(users)
+            posts = self.seed_posts(users, groups)
+            self.seed_comments(users, posts)
+            bulk.finish(users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'))
+
+    def report(self, name, count, started):
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f'{name}: {count} за {elapsed:.1f} с '
+                          f'({rate:.0f} строк/с)')
+
+    def insert(self, model, objects, **kwargs):
+        count = 0
+        for batch in batched(objects, self.options['batch_size']):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+            count += len(batch)
+        return count
+
+    def seed_users(self):
+        started = time.monotonic()
+        prefix = self.options['prefix']
+        # хэш пароля один на всех: make_password на каждого – минуты
+        password = make_password(prefix)
+        names = [f'{prefix}{number:07d}'
+                 for number in range(self.options['users'])]
+        self.insert(User, (User(username=name, password=password)
+                           for name in names), ignore_conflicts=True)
+        ids = dict(User.objects.filter(username__startswith=prefix)
+                   .values_list('username', 'id'))
+        # порядок имён – это и ранг популярности
+        users = [ids[name] for name in names]
+        self.report('Пользователи', len(users), started)
+        return users
+
+    def seed_groups(self):
+        prefix = self.options['prefix']
+        for number in range(self.options['groups']):
+            Group.objects.get_or_create(
+                slug=f'{prefix}-{number}',
+                defaults={'title': f'{prefix} {number}',
+                          'description': sentence(self.rng)})
+        return list(Group.objects.filter(slug__startswith=f'{prefix}-')
+                    .values_list('id', flat=True))
+
+    def seed_follows(self, users):
+        started = time.monotonic()
+        weights = zipf_weights(len(users), self.options['alpha'])
+        mean = self.options['follows']
+
+        def follows():
+            for user_id in users:
+                count = min(int(self.rng.expovariate(1 / mean)) if mean
+                            else 0, len(users) - 1)
+                authors = set(self.rng.choices(users, cum_weights=weights,
+                                               k=count))
+                authors.discard(user_id)
+                for author_id in authors:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        count = self.insert(Follow, follows(), ignore_conflicts=True)
+        self.report('Подписки', count, started)
+
+    def seed_images(self):
+        names = []
+        for number in range(IMAGE_COUNT):
+            buffer = io.BytesIO()
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'JPEG',
+                                                     quality=85)
+            names.append(image_storage.save(
+                f'posts/{self.options["prefix"]}-{number}.jpg',
+                ContentFile(buffer.getvalue())))
+        return names
+
+    def seed_posts(self, users, groups):
+        started = time.monotonic()
+        images = self.seed_images() if self.options['image_ratio'] else []
+        weights = zipf_weights(len(users), self.options['alpha'])
+        first_id = (Post.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        span = self.options['days'] * 24 * 60 * 60
+        dates = []
+
+        def posts():
+            for post_id in range(first_id, first_id + self.options['posts']):
+                pub_date = self.now - dt.timedelta(
+                    seconds=self.rng.randrange(span))
+                dates.append(pub_date)
+                with_image = (images and self.rng.random()
+                              < self.options['image_ratio'])
+                yield Post(
+                    id=post_id,
+                    text=sentence(self.rng),
+                    pub_date=pub_date,
+                    author_id=self.rng.choices(users, cum_weights=weights)[0],
+                    group_id=(self.rng.choice(groups)
+                              if groups and self.rng.random() < 0.5
+                              else None),
+                    image=self.rng.choice(images) if with_image else None,
+                    image_width=IMAGE_SIZE[0] if with_image else None,
+                    image_height=IMAGE_SIZE[1] if with_image else None,
+                )
+
+        count = self.insert(Post, posts())
+        self.report('Посты', count, started)
+        return list(zip(range(first_id, first_id + count), dates))
+
+    def seed_comments(self, users, posts):
+        if not posts:
+            return
+        started = time.monotonic()
+        # обсуждают тоже немногие посты, в случайном порядке популярности
+        posts = posts[:]
+        self.rng.shuffle(posts)
+        post_weights = zipf_weights(len(posts), self.options['alpha'])
+        user_weights = zipf_weights(len(users), self.options['alpha'])
+
+        def comments():
+            for _ in range(self.options['comments']):
+                post_id, pub_date = self.rng.choices(
+                    posts, cum_weights=post_weights)[0]
+                created = min(self.now, pub_date + dt.timedelta(
+                    seconds=self.rng.randrange(7 * 24 * 60 * 60)))
+                yield Comment(
+                    post_id=post_id,
+                    author_id=self.rng.choices(
+                        users, cum_weights=user_weights)[0],
+                    text=sentence(self.rng, 1, 30),
+                    created=created,
+                )
+
+        count = self.insert(Comment, comments())
+        self.report('Комментарии', count, started)
@@ -0,0 +1,62 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import ArchivedPost, Post
+
+
+def _generate(image):
+    name, width = image
+    try:
+        return name, thumbnails.generate(name, width), None
+    except Exception as error:
+        return name, 0, error
+
+
+class Command(BaseCommand):
+    help = ('Заранее готовит все миниатюры для картинок существующих постов, '
+            'в том числе архивных')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='число процессов; 0 – всё в текущем процессе',
+        )
+        parser.add_argument('--chunk-size', type=int, default=16)
+
+    def handle(self, *args, workers, chunk_size, **options):
+        # архивные посты открываются по тем же адресам и с теми же
+        # миниатюрами
+        images = list(
+            Post.objects.exclude(image='').exclude(image=None).order_by()
+            .values_list('image', 'image_width')
+            .union(ArchivedPost.objects.exclude(image='').exclude(image=None)
+                   .order_by().values_list('image', 'image_width')))
+        started = time.monotonic()
+        if workers:
+            # дочерние процессы не должны делить соединение с родителем
+            connections.close_all()
+            pool = ProcessPoolExecutor(workers,
+                                       initializer=thumbnails.init_worker)
+            with pool:
+                results = list(pool.map(_generate, images,
+                                        chunksize=chunk_size))
+        else:
+            results = [_generate(image) for image in images]
+        elapsed = time.monotonic() - started
+
+        created = 0
+        for name, count, error in results:
+            created += count
+            if error is not None:
+                self.stderr.write(f'{name}: {error}')
+        failed = sum(1 for *_, error in results if error is not None)
+        rate = len(images) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок: {len(images)}, миниатюр: {created}, ошибок: {failed}, '
+            f'{elapsed:.1f} с ({rate:.1f} картинок/с)'
+        ))
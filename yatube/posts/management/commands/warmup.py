@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+
+from yatube import warmup
+
+
+class Command(BaseCommand):
+    help = ('Прогревает процесс: шаблоны, URL, соединения с базой и кэш '
+            'страниц; с --measure сравнивает первый запрос нового '
+            'процесса без прогрева и после него')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--measure', action='store_true',
+                            help='замерить холодный старт в новых процессах')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='процессов на каждый вариант замера')
+        # запуск одного замера в дочернем процессе
+        parser.add_argument('--probe', choices=('cold', 'warm'),
+                            help=argparse.SUPPRESS)
+
+    def handle(self, *args, measure, repeat, probe, **options):
+        if probe:
+            self.stdout.write(json.dumps(self.probe(probe)))
+            return
+        report = warmup.run()
+        for name, seconds, detail in report:
+            self.stdout.write(f'{name:<10} {seconds * 1000:>8.0f} мс  '
+                              f'{detail}')
+        total = sum(seconds for _, seconds, _ in report)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прогрев за {total * 1000:.0f} мс'))
+        if measure:
+            self.measure(repeat)
+
+    @staticmethod
+    def probe(mode):
+        # как yatube/wsgi.py: приложение, прогрев, закрытые соединения,
+        # затем по одному запросу на страницу
+        started = time.perf_counter()
+        application = get_wsgi_application()
+        if mode == 'warm':
+            warmup.run(application)
+            connections.close_all()
+        ready = time.perf_counter() - started
+        host = warmup.default_host()
+        first = {}
+        for path in settings.WARMUP_PATHS:
+            _, elapsed = warmup.get_page(application, path, host)
+            first[path] = elapsed * 1000
+        return {'ready_ms': ready * 1000, 'first_ms': first}
+
+    def measure(self, repeat):
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        environ = dict(os.environ,
+                       DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        results = {}
+        # страницы уже в общем кэше после прогрева выше, поэтому разница –
+        # только в том, что каждый процесс готовит у себя
+        for mode in ('cold', 'warm'):
+            runs = []
+            for _ in range(repeat):
+                child = subprocess.run(
+                    [sys.executable, manage, 'warmup', '--probe', mode],
+                    env=environ, capture_output=True, text=True)
+                if child.returncode:
+                    raise CommandError(child.stderr.strip())
+                runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+            results[mode] = {
+                'ready_ms': statistics.median(
+                    run['ready_ms'] for run in runs),
+                'first_ms': {
+                    path: statistics.median(run['first_ms'][path]
+                                            for run in runs)
+                    for path in settings.WARMUP_PATHS
+                },
+            }
+        self.stdout.write(f'\nХолодный старт, медиана {repeat} процессов:')
+        self.stdout.write(f'{"":<24} {"без прогрева":>14} {"с прогревом":>14}')
+        self.stdout.write(
+            f'{"до готовности":<24} '
+            f'{results["cold"]["ready_ms"]:>11.0f} мс '
+            f'{results["warm"]["ready_ms"]:>11.0f} мс')
+        for path in settings.WARMUP_PATHS:
+            self.stdout.write(
+                f'{"первый " + path:<24} '
+                f'{results["cold"]["first_ms"][path]:>11.0f} мс '
+                f'{results["warm"]["first_ms"][path]:>11.0f} мс')
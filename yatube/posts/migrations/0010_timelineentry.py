@@ -0,0 +1,56 @@
+# Generated by Django 2.2.13 on 2026-10-18 03:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Значения на момент миграции: историческая миграция не должна зависеть
+# от текущих настроек. Авторов с большим числом подписчиков не
+# раскладываем, как и posts.timeline.fan_out
+FANOUT_LIMIT = 1000
+BATCH_SIZE = 500
+
+
+def backfill_timelines(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    authors = (Follow.objects.order_by().values('author_id')
+               .annotate(followers=models.Count('id'))
+               .filter(followers__lte=FANOUT_LIMIT)
+               .values_list('author_id', flat=True))
+    for author_id in authors:
+        posts = list(Post.objects.filter(
+            author_id=author_id).values_list('id', flat=True))
+        followers = Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post_id=post_id)
+             for user_id in followers for post_id in posts),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_auto_20200728_2041'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 2.2.13 on 2026-10-18 04:20
+
+import datetime as dt
+import math
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+# Копия правил posts.trending на момент миграции: историческая миграция не
+# должна меняться вместе с кодом приложения. Вес события затухает вдвое за
+# сутки, рейтинг – логарифм суммы весов exp((t - EPOCH) / TAU).
+EPOCH = dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc)
+TAU = 24 * 60 * 60 / math.log(2)
+POST_WEIGHT = 2
+COMMENT_WEIGHT = 1
+MIN_WEIGHT = 0.01
+
+
+def event_score(when, weight):
+    return math.log(weight) + (when - EPOCH).total_seconds() / TAU
+
+
+def logaddexp(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def fill_scores(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    PostScore = apps.get_model('posts', 'PostScore')
+    # более старые события весят меньше MIN_WEIGHT
+    since = timezone.now() - dt.timedelta(seconds=-math.log(MIN_WEIGHT) * TAU)
+    scores = {}
+    groups = {}
+    recent = Post.objects.filter(pub_date__gte=since).values_list(
+        'id', 'group_id', 'pub_date')
+    for post_id, group_id, pub_date in recent.iterator():
+        scores[post_id] = event_score(pub_date, POST_WEIGHT)
+        groups[post_id] = group_id
+    commented = Comment.objects.exclude(post=None).filter(
+        created__gte=since).values_list('post_id', 'created')
+    for post_id, created in commented.iterator():
+        event = event_score(created, COMMENT_WEIGHT)
+        previous = scores.get(post_id)
+        scores[post_id] = (event if previous is None
+                           else logaddexp(previous, event))
+    missing = [post_id for post_id in scores if post_id not in groups]
+    for start in range(0, len(missing), 500):
+        groups.update(Post.objects.filter(pk__in=missing[start:start + 500])
+                      .values_list('id', 'group_id'))
+    PostScore.objects.bulk_create(
+        (PostScore(post_id=post_id, group_id=groups.get(post_id),
+                   score=score)
+         for post_id, score in scores.items()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='posts.Post')),
+                ('score', models.FloatField()),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='post_scores', to='posts.Group')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['-score'], name='postscore_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['group', '-score'], name='postscore_group_score_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.13 on 2026-10-18 04:24
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def fill_blobs(apps, schema_editor):
+    # прежние файлы лежат под исходными именами, но считаются так же
+    ImageBlob = apps.get_model('posts', 'ImageBlob')
+    refs = {}
+    for name in ('Post', 'ArchivedPost'):
+        model = apps.get_model('posts', name)
+        counts = (model.objects.exclude(image='').exclude(image=None)
+                  .values_list('image').annotate(Count('pk')).order_by())
+        for image, count in counts:
+            refs[image] = refs.get(image, 0) + count
+    ImageBlob.objects.bulk_create(
+        (ImageBlob(name=image, refs=count) for image, count in refs.items()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('refs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        # хранилище в базе никак не отражено, а AlterField в SQLite
+        # пересоздал бы таблицу постов вместе с триггерами поиска
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='archivedpost',
+                name='image',
+                field=models.ImageField(blank=True, null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/'),
+            ),
+            migrations.AlterField(
+                model_name='post',
+                name='image',
+                field=models.ImageField(blank=True, height_field='image_height', null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', width_field='image_width'),
+            ),
+        ]),
+        migrations.RunPython(fill_blobs, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import image_storage
+
 User = get_user_model()
 
 
@@ -20,13 +22,39 @@ class Post(models.Model):
                                related_name="posts")
     group = models.ForeignKey(Group, on_delete=models.SET_NULL,
                               related_name="posts", blank=True, null=True)
-    image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image = models.ImageField(upload_to='posts/', storage=image_storage,
+                              blank=True, null=True,
+                              width_field='image_width',
+                              height_field='image_height')
+    image_width = models.PositiveIntegerField(blank=True, null=True,
+                                              editable=False)
+    image_height = models.PositiveIntegerField(blank=True, null=True,
+                                               editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        # счётчик комментариев меняется только через F() в posts.counters,
+        # иначе сохранение формы затёрло бы его значением из памяти
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comments_count'
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -42,6 +70,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['created']
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -52,3 +84,134 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['user', 'author']
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    # копия Post.pub_date, чтобы лента читалась по индексу без сортировки
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='stats')
+    posts_count = models.PositiveIntegerField(default=0)
+    # подписчики автора
+    followers_count = models.PositiveIntegerField(default=0)
+    # авторы, на которых подписан пользователь
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class ImageBlob(models.Model):
+    """
+    Файл картинки в posts.storage и число постов (в том числе архивных),
+    которые на него ссылаются.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    refs = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+# Холодный архив (команда archive_posts): старые посты и их комментарии
+# переезжают сюда с прежними id, чтобы ссылки на них продолжали работать,
+# а таблицы и индексы горячих постов оставались небольшими
+
+class ArchivedPost(models.Model):
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField()
+    pub_date = models.DateTimeField("date published")
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="archived_posts")
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL,
+                              related_name="archived_posts", blank=True,
+                              null=True)
+    image = models.ImageField(upload_to='posts/', storage=image_storage,
+                              blank=True, null=True)
+    image_width = models.PositiveIntegerField(blank=True, null=True)
+    image_height = models.PositiveIntegerField(blank=True, null=True)
+    comments_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    def __str__(self):
+        return self.text
+
+    class Meta:
+        ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='archived_author_pub_date_idx'),
+        ]
+
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE,
+                             related_name='comments')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="archived_comments")
+    text = models.TextField(max_length=1000)
+    created = models.DateTimeField("date published")
+
+    def __str__(self):
+        return self.text
+
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='archived_comment_created_idx'),
+        ]
+
+
+class PostScore(models.Model):
+    """
+    Рейтинг поста для страницы популярного (posts.trending): логарифм
+    суммы затухающих весов событий, отсчитанных от общей точки, поэтому
+    порядок постов не зависит от текущего момента и не пересчитывается.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE,
+                                primary_key=True, related_name='score')
+    # копия Post.group для рейтинга внутри группы по индексу
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL,
+                              related_name='post_scores', blank=True,
+                              null=True)
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='postscore_score_idx'),
+            models.Index(fields=['group', '-score'],
+                         name='postscore_group_score_idx'),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Сколько записей файла уже загрузила команда import_posts. Пишется в
+    одной транзакции с пачкой, поэтому после сбоя пачка повторяется
+    целиком или не повторяется вовсе.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    done = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.done}'
@@ -0,0 +1,178 @@
+import base64
+import binascii
+import functools
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Постраничный вывод по ключу сортировки вместо OFFSET: страница
+    выбирается условием "строго после/до последней показанной записи",
+    поэтому стоимость запроса не зависит от глубины и COUNT(*) не нужен.
+    Последнее поле в ordering должно быть уникальным (обычно id).
+    """
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def get_page(self, cursor=None):
+        direction, values = self.decode_cursor(cursor)
+        rows = list(self._page_queryset(direction, values))
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == self.PREVIOUS:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        return CursorPage(
+            rows,
+            self.encode_cursor(self.NEXT, rows[-1])
+            if has_next and rows else None,
+            self.encode_cursor(self.PREVIOUS, rows[0])
+            if has_previous and rows else None,
+        )
+
+    def page_queryset(self, cursor=None):
+        return self._page_queryset(*self.decode_cursor(cursor))
+
+    def _page_queryset(self, direction, values, object_list=None):
+        queryset = self.object_list if object_list is None else object_list
+        if direction == self.PREVIOUS:
+            ordering = [self._reverse(name) for name in self.ordering]
+            queryset = queryset.filter(self._seek(values, reverse=True))
+        else:
+            ordering = self.ordering
+            if values is not None:
+                queryset = queryset.filter(self._seek(values))
+        return queryset.order_by(*ordering)[:self.per_page + 1]
+
+    def encode_cursor(self, direction, item):
+        values = [getattr(item, name) for name in self.fields]
+        payload = json.dumps(
+            [direction] + [self._dump(value) for value in values],
+            separators=(',', ':'),
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return self.NEXT, None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, raw = payload[0], payload[1:]
+            if (direction not in (self.NEXT, self.PREVIOUS)
+                    or len(raw) != len(self.fields)):
+                raise ValueError(cursor)
+            values = [self._field(name).to_python(value)
+                      for name, value in zip(self.fields, raw)]
+            # целое вне 64 бит база не примет (OverflowError при запросе)
+            if any(isinstance(value, int)
+                   and not INT64_MIN <= value <= INT64_MAX
+                   for value in values):
+                raise ValueError(cursor)
+        except (binascii.Error, ValueError, TypeError, IndexError, KeyError,
+                OverflowError, ValidationError):
+            # испорченный курсор – просто первая страница, как get_page()
+            return self.NEXT, None
+        return direction, values
+
+    def _seek(self, values, reverse=False):
+        # (a, b) < (x, y)  ->  a < x OR (a = x AND b < y)
+        condition = Q()
+        equal = {}
+        for name, field, value in zip(self.ordering, self.fields, values):
+            descending = name.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def _field(self, name):
+        try:
+            return self.object_list.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # сортировка по аннотации, как в ленте подписок
+            return self.object_list.query.annotations[name].output_field
+
+    @staticmethod
+    def _reverse(name):
+        return name[1:] if name.startswith('-') else '-' + name
+
+    @staticmethod
+    def _dump(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+
+class TieredCursorPaginator(CursorPaginator):
+    """
+    Тот же курсор по нескольким запросам с одинаковым ключом сортировки
+    (горячие посты и архив, лента и посты знаменитостей): из каждого
+    берётся страница после курсора, результаты сливаются, лишнее
+    отбрасывается.
+    """
+    def __init__(self, tiers, per_page, ordering=('-pub_date', '-id')):
+        super().__init__(tiers[0], per_page, ordering)
+        self.tiers = tiers
+
+    def _page_queryset(self, direction, values):
+        rows = []
+        for tier in self.tiers:
+            rows += super()._page_queryset(direction, values, tier)
+        reverse = direction == self.PREVIOUS
+        rows.sort(key=functools.cmp_to_key(
+            lambda a, b: self._compare(a, b, reverse)))
+        # одна запись может оказаться в двух ярусах (пост знаменитости,
+        # ещё не убранный из ленты): ключ сортировки у копий одинаковый
+        unique = []
+        for row in rows:
+            if not unique or self._compare(unique[-1], row, reverse):
+                unique.append(row)
+        return unique[:self.per_page + 1]
+
+    def _compare(self, a, b, reverse):
+        for name, field in zip(self.ordering, self.fields):
+            left, right = getattr(a, field), getattr(b, field)
+            if left != right:
+                result = (left > right) - (left < right)
+                descending = name.startswith('-') != reverse
+                return -result if descending else result
+        return 0
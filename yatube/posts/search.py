@@ -0,0 +1,115 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .feeds import feed
+
+# метки начала и конца совпадения в сниппете: сам сниппет экранируется,
+# и только потом метки превращаются в <mark>
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+
+
+class SearchResult:
+    def __init__(self, post, snippet):
+        self.post = post
+        self.snippet = snippet
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())[:16]
+
+
+def _highlight(snippet):
+    html = escape(snippet)
+    html = html.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+class SQLiteBackend:
+    # posts_post_fts – внешний FTS5-индекс по posts_post.text, его
+    # поддерживают триггеры из миграции 0014_post_search
+    def match(self, terms, limit, offset):
+        # каждое слово – отдельная фраза с поиском по префиксу, чтобы
+        # пользовательский ввод не разбирался как синтаксис FTS5
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid, snippet(posts_post_fts, 0, %s, %s, %s, %s) '
+                'FROM posts_post_fts WHERE posts_post_fts MATCH %s '
+                'ORDER BY rank LIMIT %s OFFSET %s',
+                [MARK_START, MARK_END, '…', SNIPPET_TOKENS, match,
+                 limit, offset],
+            )
+            return cursor.fetchall()
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO posts_post_fts(posts_post_fts) "
+                "VALUES ('rebuild')")
+
+
+class PostgreSQLBackend:
+    # GIN-индекс по to_tsvector('russian', text) из 0014_post_search
+    config = 'russian'
+
+    def match(self, terms, limit, offset):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, ts_headline(%s, text, q, %s) '
+                'FROM posts_post, to_tsquery(%s, %s) q '
+                'WHERE to_tsvector(%s, text) @@ q '
+                'ORDER BY ts_rank_cd(to_tsvector(%s, text), q) DESC, id DESC '
+                'LIMIT %s OFFSET %s',
+                [self.config,
+                 f'StartSel={MARK_START}, StopSel={MARK_END}, '
+                 f'MaxWords={SNIPPET_TOKENS}, MinWords=5',
+                 self.config, query, self.config, self.config,
+                 limit, offset],
+            )
+            return cursor.fetchall()
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX posts_post_text_search_idx')
+
+
+class FallbackBackend:
+    # без полнотекстового индекса – LIKE по тексту, только для разработки
+    def match(self, terms, limit, offset):
+        posts = feed()
+        for term in terms:
+            posts = posts.filter(text__icontains=term)
+        return [(post_id, text[:200]) for post_id, text in
+                posts.values_list('id', 'text')[offset:offset + limit]]
+
+    def rebuild(self):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, FallbackBackend)()
+
+
+def search(query, limit=10, offset=0):
+    terms = _terms(query)
+    if not terms:
+        return []
+    rows = get_backend().match(terms, limit, offset)
+    posts = feed().in_bulk([post_id for post_id, _ in rows])
+    return [SearchResult(posts[post_id], _highlight(snippet))
+            for post_id, snippet in rows if post_id in posts]
+
+
+def rebuild():
+    get_backend().rebuild()
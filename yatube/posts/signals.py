@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import blobs, cache, counters, thumbnails, timeline, trending
+from .models import (ArchivedPost, Comment, Follow, Group, Post, PostScore,
+                     User, UserStats)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.post_id:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id:
+        counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, followers_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+        timeline.followers_changed(instance.author_id, created=True)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, followers_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+    timeline.followers_changed(instance.author_id, created=False)
+
+
+# Сброс кэша страниц (posts.cache): сдвигаются версии только тех областей,
+# которые затронуты изменением
+
+def _group_slugs(*group_ids):
+    group_ids = {group_id for group_id in group_ids if group_id}
+    if not group_ids:
+        return []
+    return Group.objects.filter(pk__in=group_ids).values_list('slug',
+                                                            flat=True)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, raw=False, **kwargs):
+    instance._previous_group_id = instance._previous_image = None
+    if not raw and not instance._state.adding:
+        previous = (Post.objects.filter(pk=instance.pk)
+                    .values_list('group_id', 'image').first())
+        if previous is not None:
+            instance._previous_group_id, instance._previous_image = previous
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_group_id', None)
+    cache.bump(*cache.post_scopes(
+        instance, _group_slugs(instance.group_id, previous)))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        cache.bump(*cache.post_scopes(post, _group_slugs(post.group_id)))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    cache.bump(f'profile:{instance.author.username}',
+               f'profile:{instance.user.username}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    # название группы выводится в карточках на всех страницах
+    cache.bump(cache.SITE)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    cache.bump(f'profile:{instance.username}')
+
+
+# Ссылки на файлы картинок (posts.blobs): замена картинки при правке поста
+# освобождает старый файл, удаление поста – его файл
+
+@receiver(post_save, sender=Post)
+def track_image(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    image = instance.image.name if instance.image else None
+    previous = instance._previous_image or None
+    if image == previous:
+        return
+    if previous:
+        blobs.release(previous)
+    # у уже известного файла миниатюры готовы: их ключ – имя, то есть хэш
+    if image and blobs.acquire(image):
+        thumbnails.schedule(image, instance.image_width)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+def release_image(sender, instance, **kwargs):
+    if instance.image:
+        blobs.release(instance.image.name)
+
+
+# Популярное (posts.trending): публикация и комментарии добавляют посту
+# рейтинг, смена группы переносит его в другую ленту популярного
+
+@receiver(post_save, sender=Post)
+def score_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        trending.record(instance.pk, instance.pub_date,
+                        settings.TRENDING_POST_WEIGHT)
+    elif instance.group_id != instance._previous_group_id:
+        PostScore.objects.filter(post_id=instance.pk).update(
+            group_id=instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+def score_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.post_id:
+        trending.record(instance.post_id, instance.created,
+                        settings.TRENDING_COMMENT_WEIGHT)
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище картинок постов: файл сохраняется под SHA-256 содержимого
+    (posts/ab/abcdef….jpg), одинаковые загрузки ложатся в один файл. Хэш
+    считается по ходу записи во временный файл, который затем атомарно
+    переименовывается – или удаляется, если такой файл уже есть. Сколько
+    постов ссылаются на файл, учитывает posts.blobs.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # имя всё равно заменит хэш содержимого, а совпадение имён – это
+        # совпадение содержимого
+        return name
+
+    def _save(self, name, content):
+        directory, basename = posixpath.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.path(directory),
+                                         suffix='.part')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as destination:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    destination.write(chunk)
+            digest = digest.hexdigest()
+            name = posixpath.join(directory, digest[:2], digest + extension)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temporary)
+                return name
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+
+image_storage = ContentAddressedStorage()
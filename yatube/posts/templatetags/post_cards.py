@@ -0,0 +1,71 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+from posts import images
+from yatube.metrics import record_cache
+
+register = template.Library()
+
+CARD_KEY = 'posts:card:{}:{}'
+# на месте этой метки в закэшированной карточке выводится ссылка
+# "Редактировать" – единственная часть, зависящая от зрителя
+EDIT_LINK_SLOT = '<!--post-edit-link-->'
+
+
+def card_version(post):
+    # карточка целиком определяется этими полями, поэтому правка поста,
+    # новый комментарий или замена картинки дают новый ключ
+    group = post.group
+    parts = [
+        post.text, str(post.image or ''), str(post.pub_date),
+        str(post.comments_count), post.author.username,
+        group.slug if group else '', group.title if group else '',
+        translation.get_language() or '',
+    ]
+    return hashlib.md5('\x1f'.join(parts).encode()).hexdigest()
+
+
+def render_cards(posts, user):
+    posts = list(posts)
+    keys = [CARD_KEY.format(post.pk, card_version(post)) for post in posts]
+    cards = cache.get_many(keys)
+    missing = {}
+    card_template = get_template('includes/post_item.html')
+    for post, key in zip(posts, keys):
+        if key not in cards:
+            missing[key] = cards[key] = card_template.render(
+                {'post': post, 'edit_link': mark_safe(EDIT_LINK_SLOT)})
+    if missing:
+        cache.set_many(missing, settings.POSTS_CARD_CACHE_TIMEOUT)
+    record_cache('card', len(posts) - len(missing), len(missing))
+    edit_template = get_template('includes/post_edit_link.html')
+    html = []
+    for post, key in zip(posts, keys):
+        edit_link = ''
+        # архивные посты не редактируются
+        if (user is not None and user.pk == post.author_id
+                and not getattr(post, 'is_archived', False)):
+            edit_link = edit_template.render({'post': post})
+        html.append(cards[key].replace(EDIT_LINK_SLOT, edit_link))
+    return mark_safe(''.join(html))
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    return render_cards(posts, context.get('user'))
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return render_cards([post], context.get('user'))
+
+
+@register.simple_tag
+def card_image(post):
+    return images.card_image(post.image, post.image_width)
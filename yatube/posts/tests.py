@@ -1,12 +1,49 @@
+import base64
+import datetime as dt
+import importlib
 import io
+import json
+import os
+import threading
+import time
+import zipfile
+from unittest import mock
 
 from PIL import Image
+from django.conf import settings
 from django.core.files.base import ContentFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.db import router as db_router
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Post, User, Group, Comment, Follow
+from django.utils import timezone
+from posts.models import (Post, User, Group, Comment, Follow,
+                          TimelineEntry, UserStats, ArchivedPost, PostScore,
+                          ImageBlob, ImportCheckpoint)
+from posts import blobs, feeds, follows, timeline, trending
+from posts.management.commands import import_posts
+from posts.images import thumbnail_variants
+from posts.paginator import CursorPaginator
+from posts.search import search as search_posts
+from posts.templatetags.post_cards import (CARD_KEY, EDIT_LINK_SLOT,
+                                          card_version, render_cards)
 import tempfile
 from django.core.cache import cache
+from sorl.thumbnail import get_thumbnail
+from yatube.cache_backends import LockedFileBasedCache, TwoTierCache
+from yatube.db_router import PrimaryPinMiddleware
+from yatube.metrics import Registry, RequestStats, fingerprint, registry
+from yatube import ratelimit
+
+
+def setUpModule():
+    # общий уровень кэша – файлы, они переживают прошлый прогон тестов
+    cache.clear()
 
 
 # CASH = {'default': {
@@ -284,13 +321,79 @@ class TestCache(TestCase):
         )
         self.assertRedirects(response, '/')
         self.assertEqual(Post.objects.count(), 2)
-        response = self.client.get(reverse('index'))
         self.assertContains(response, 'Test post')
-        self.assertNotContains(response, 'test_cache_index')
-        cache.clear()
-        response = self.client.get(reverse('index'))
         self.assertContains(response, 'test_cache_index')
 
+    def test_cache_until_change(self):
+        url = reverse('post', kwargs={'username': self.user.username,
+                                      'post_id': self.post.id})
+        self.client.get(url)
+        # update() не шлёт сигналов – страница остаётся из кэша
+        Post.objects.filter(pk=self.post.pk).update(text='silent edit')
+        self.assertContains(self.client.get(url), 'Test post')
+        self.assertContains(self.client.get(reverse('index')), 'silent edit')
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='test comment')
+        self.assertContains(self.client.get(url), 'silent edit')
+
+    def test_group_change_invalidates_both_groups(self):
+        other = Group.objects.create(title='other', slug='other',
+                                     description='other group')
+        url = reverse('group', kwargs={'slug': self.group.slug})
+        self.assertContains(self.client.get(url), 'Test post')
+        self.post.group = other
+        self.post.save()
+        self.assertNotContains(self.client.get(url), 'Test post')
+        self.assertContains(
+            self.client.get(reverse('group', kwargs={'slug': 'other'})),
+            'Test post')
+
+    def test_conditional_get(self):
+        url = reverse('post', args=[self.user.username, self.post.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='new comment')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unknown_query_params_share_entry(self):
+        url = reverse('index')
+        self.client.get(url)
+        # лишние параметры не заводят новых записей в кэше
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'utm_source': 'x', 'r': '42'})
+        self.assertContains(response, 'Test post')
+        post = reverse('post', args=[self.user.username, self.post.id])
+        self.client.get(post)
+        with self.assertNumQueries(0):
+            self.client.get(post, {'cursor': 'anything'})
+        # а параметр, который view читает, – заводит
+        with self.assertNumQueries(1):
+            self.client.get(url, {'cursor': 'bad'})
+
+    def test_etag_per_viewer(self):
+        reader = User.objects.create_user(username='reader',
+                                          password='12345')
+        url = reverse('profile', args=[self.user.username])
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Подписаться')
+        etag = response['ETag']
+        Follow.objects.create(user=reader, author=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Отписаться')
+
 
 class TestFollow(TestCase):
     def setUp(self):
@@ -344,3 +447,1449 @@ class TestFollow(TestCase):
         response = self.client.get(reverse('follow_index'), follow=True)
         self.assertContains(response, 'test_follow_index')
         self.assertNotContains(response, 'Test post')
+
+    def test_follow_idempotent(self):
+        self.client.force_login(self.user1)
+        url = reverse("profile_follow", args=[self.user2])
+        for _ in range(2):
+            response = self.client.post(url,
+                                        HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(response.json(),
+                             {'following': True, 'followers_count': 1})
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(UserStats.objects.get(user=self.user2)
+                         .followers_count, 1)
+        # повторный клик: автор со счётчиком и вставка без эффекта
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        writes = [query for query in queries
+                  if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(writes), 1)
+
+    def test_unfollow_idempotent(self):
+        self.client.force_login(self.user1)
+        url = reverse("profile_unfollow", args=[self.user2])
+        response = self.client.get(url)
+        self.assertRedirects(response, f'/{self.user2}/')
+        self.client.get(reverse("profile_follow", args=[self.user2]))
+        for _ in range(2):
+            response = self.client.post(
+                url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(response.json(),
+                             {'following': False, 'followers_count': 0})
+        self.assertEqual(UserStats.objects.get(user=self.user2)
+                         .followers_count, 0)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user1)
+                         .exists())
+
+    def test_follow_self_and_missing(self):
+        self.client.force_login(self.user1)
+        response = self.client.post(
+            reverse("profile_follow", args=[self.user1]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json(),
+                         {'following': False, 'followers_count': 0})
+        self.assertEqual(Follow.objects.count(), 0)
+        response = self.client.get(
+            reverse("profile_follow", args=['nobody']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_profile_sets_csrf_cookie(self):
+        cache.clear()
+        url = reverse('profile', args=[self.user2])
+        first = Client(enforce_csrf_checks=True)
+        first.force_login(self.user1)
+        first.get(url)
+        # второй ответ – из кэша страниц, но со своим токеном в cookie
+        second = Client(enforce_csrf_checks=True)
+        second.force_login(self.user1)
+        with self.assertNumQueries(2):
+            response = second.get(url)
+        token = response.cookies['csrftoken'].value
+        self.assertNotContains(response, token)
+        response = second.post(reverse('profile_follow', args=[self.user2]),
+                               HTTP_X_CSRFTOKEN=token,
+                               HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(),
+                         {'following': True, 'followers_count': 1})
+
+
+class TestCursorPaginator(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='TestUser',
+            email='test@user.com',
+            password='12345'
+        )
+        self.posts = [
+            Post.objects.create(text=f'post {i}', author=self.user)
+            for i in range(12)
+        ]
+        cache.clear()
+
+    def test_walk_pages(self):
+        paginator = CursorPaginator(Post.objects.all(), 5)
+        page = paginator.get_page()
+        self.assertFalse(page.has_previous())
+        seen = [post.id for post in page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen += [post.id for post in page]
+        expected = [post.id for post in reversed(self.posts)]
+        self.assertEqual(seen, expected)
+        previous = paginator.get_page(page.previous_cursor)
+        self.assertEqual([post.id for post in previous], expected[5:10])
+        self.assertTrue(previous.has_next())
+
+    def test_broken_cursor(self):
+        response = self.client.get(reverse('index'), {'cursor': '%%%'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'post 11')
+        # курсор разбирается, но id не влезает в 64 бита
+        cursor = base64.urlsafe_b64encode(json.dumps(
+            ['n', '2020-01-01T00:00:00+00:00', 2 ** 70]).encode()).decode()
+        for url in (reverse('index'), reverse('profile',
+                                              args=[self.user.username]),
+                    reverse('api_posts')):
+            response = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'post 11')
+
+    def test_next_page_link(self):
+        response = self.client.get(
+            reverse('profile', kwargs={'username': self.user.username}))
+        page = response.context['page']
+        self.assertContains(response, f'?cursor={page.next_cursor}')
+        response = self.client.get(
+            reverse('profile', kwargs={'username': self.user.username}),
+            {'cursor': page.next_cursor})
+        self.assertEqual([post.text for post in response.context['page']],
+                         [f'post {i}' for i in range(6, 1, -1)])
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username='Reader',
+            email='reader@user.com',
+            password='12345'
+        )
+        self.author = User.objects.create_user(
+            username='Author',
+            email='author@user.com',
+            password='12345'
+        )
+        Post.objects.create(text='old post', author=self.author)
+        self.client.force_login(self.reader)
+
+    def publish(self, text):
+        client = Client()
+        client.force_login(self.author)
+        client.post(reverse('new_post'), data={'text': text})
+
+    def test_fan_out_and_prune(self):
+        self.client.get(reverse('profile_follow', args=[self.author]))
+        self.publish('fresh post')
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader).count(), 2)
+        response = self.client.get(reverse('follow_index'))
+        self.assertContains(response, 'old post')
+        self.assertContains(response, 'fresh post')
+        self.client.get(reverse('profile_unfollow', args=[self.author]))
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.client.get(reverse('follow_index'))
+        self.assertNotContains(response, 'fresh post')
+
+    def test_follow_index_pages(self):
+        self.client.get(reverse('profile_follow', args=[self.author]))
+        for i in range(12):
+            self.publish(f'post {i}')
+        response = self.client.get(reverse('follow_index'))
+        cursor = response.context['page'].next_cursor
+        response = self.client.get(reverse('follow_index'),
+                                   {'cursor': cursor})
+        self.assertEqual([post.text for post in response.context['page']],
+                         ['post 1', 'post 0', 'old post'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_read_path(self):
+        self.client.get(reverse('profile_follow', args=[self.author]))
+        self.publish('fresh post')
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.client.get(reverse('follow_index'))
+        self.assertContains(response, 'old post')
+        self.assertContains(response, 'fresh post')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_fanout_threshold_crossing(self):
+        other = User.objects.create_user(username='other')
+        friend = User.objects.create_user(username='friend')
+        Post.objects.create(text='friend post', author=friend)
+        follows.follow(self.reader, self.author)
+        follows.follow(self.reader, friend)
+        timeline.backfill(self.reader, self.author)
+        timeline.backfill(self.reader, friend)
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+        # второй подписчик: автор стал знаменитостью, лента читается из
+        # записей друга и из постов автора по индексу
+        follows.follow(other, self.author)
+        self.assertFalse(TimelineEntry.objects.filter(
+            post__author=self.author).exists())
+        tiers = feeds.follow_feed(self.reader)
+        self.assertEqual(len(tiers), 2)
+        page = feeds.paginator(tiers, 10,
+                               ordering=feeds.FOLLOW_ORDERING).get_page()
+        self.assertEqual([post.text for post in page],
+                         ['friend post', 'old post'])
+        # снова под порогом: посты возвращаются в ленты всех подписчиков
+        follows.unfollow(other, self.author)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader, post__author=self.author).count(), 1)
+        self.assertEqual(len(feeds.follow_feed(self.reader)), 1)
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='TestUser',
+            email='test@user.com',
+            password='12345'
+        )
+        self.reader = User.objects.create_user(
+            username='Reader',
+            email='reader@user.com',
+            password='12345'
+        )
+        self.post = Post.objects.create(text='Test post', author=self.user)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='test comment')
+        Follow.objects.create(user=self.reader, author=self.user)
+        cache.clear()
+
+    def test_counters_follow_writes(self):
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(UserStats.objects.get(
+            user=self.reader).following_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        Follow.objects.all().delete()
+        Comment.objects.all().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(UserStats.objects.get(
+            user=self.user).followers_count, 0)
+
+    def test_edit_keeps_comment_count(self):
+        post = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='another comment')
+        post.text = 'Test edit post'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+
+    def test_rebuild_counters(self):
+        UserStats.objects.filter(user=self.user).update(posts_count=7)
+        Post.objects.update(comments_count=5)
+        out = io.StringIO()
+        call_command('rebuild_counters', '--dry-run', stdout=out)
+        self.assertIn('пользователи – 1, посты – 1', out.getvalue())
+        call_command('rebuild_counters', stdout=io.StringIO())
+        self.assertEqual(UserStats.objects.get(
+            user=self.user).posts_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_profile_without_aggregates(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('profile', kwargs={'username': self.user.username}))
+        self.assertContains(response, 'Записей: 1')
+        self.assertContains(response, '1 комментариев')
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'COUNT(' in query['sql']])
+
+
+class TestFeedQueries(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='TestUser',
+            email='test@user.com',
+            password='12345'
+        )
+        self.reader = User.objects.create_user(
+            username='Reader',
+            email='reader@user.com',
+            password='12345'
+        )
+        self.group = Group.objects.create(
+            title='group',
+            slug='group',
+            description='test group'
+        )
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.client.force_login(self.reader)
+        self.urls = [
+            reverse('index'),
+            reverse('group', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+            reverse('follow_index'),
+        ]
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f'post {i}', group=self.group,
+                                       author=self.user)
+            timeline.fan_out(post)
+            Comment.objects.create(post=post, author=self.reader,
+                                   text='test comment')
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_constant_queries_per_page(self):
+        self.add_posts(1)
+        single = [self.count_queries(url) for url in self.urls]
+        self.add_posts(4)
+        several = [self.count_queries(url) for url in self.urls]
+        self.assertEqual(single, several)
+
+
+class TestPostCards(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='TestUser',
+            email='test@user.com',
+            password='12345'
+        )
+        self.reader = User.objects.create_user(
+            username='Reader',
+            email='reader@user.com',
+            password='12345'
+        )
+        self.post = Post.objects.create(text='Test post', author=self.user)
+        self.edit_url = reverse('post_edit', kwargs={
+            'username': self.user.username, 'post_id': self.post.id})
+        cache.clear()
+
+    def test_edit_link_rendered_per_viewer(self):
+        html = render_cards([self.post], self.reader)
+        self.assertNotIn(self.edit_url, html)
+        self.assertNotIn(EDIT_LINK_SLOT, html)
+        self.assertIn(self.edit_url, render_cards([self.post], self.user))
+
+    def test_card_cached_until_change(self):
+        render_cards([self.post], None)
+        key = CARD_KEY.format(self.post.pk, card_version(self.post))
+        self.assertIn('Test post', cache.get(key))
+        self.post.text = 'silent edit'
+        self.assertNotEqual(
+            key, CARD_KEY.format(self.post.pk, card_version(self.post)))
+        Post.objects.filter(pk=self.post.pk).update(comments_count=3)
+        self.post.refresh_from_db()
+        self.assertIn('3 комментариев', render_cards([self.post], None))
+
+
+class TestQueryPlans(TestCase):
+    def test_feeds_use_indexes(self):
+        out = io.StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FAIL', out.getvalue())
+        self.assertIn('follow_index_celebrity[1]: OK', out.getvalue())
+
+    def test_or_follow_feed_fails(self):
+        # прежняя лента со знаменитостями: OR и DISTINCT по всем постам
+        def or_feed(user, celebrities=None):
+            return [Post.objects.filter(
+                Q(timeline_entries__user=user) | Q(author_id__in=[2])
+            ).annotate(feed_date=F('pub_date'), feed_id=F('id')).distinct()]
+
+        with mock.patch('posts.timeline.timeline_tiers', or_feed):
+            with self.assertRaises(CommandError):
+                call_command('check_query_plans', stdout=io.StringIO())
+
+
+class TestThumbnails(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='TestUser',
+            email='test@user.com',
+            password='12345'
+        )
+
+    def create_post(self):
+        byte_image = io.BytesIO()
+        Image.new('RGB', size=(500, 500)).save(byte_image, format='jpeg')
+        return Post.objects.create(
+            text='post with image', author=self.user,
+            image=ContentFile(byte_image.getvalue(), name='test.jpg'))
+
+    def test_thumbnails_scheduled_on_upload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(MEDIA_ROOT=tmp):
+                with mock.patch('posts.thumbnails.schedule') as schedule:
+                    post = self.create_post()
+                    schedule.assert_called_once_with(post.image.name, 500)
+                    post.text = 'edit without new image'
+                    post.save()
+                    schedule.assert_called_once()
+
+    def test_warm_thumbnails(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(MEDIA_ROOT=tmp):
+                post = self.create_post()
+                # картинка архивного поста тоже прогревается
+                Post.objects.filter(pk=post.pk).update(
+                    pub_date=timezone.now() - dt.timedelta(days=400))
+                call_command('archive_posts', stdout=io.StringIO())
+                out = io.StringIO()
+                call_command('warm_thumbnails', '--workers', '0',
+                             stdout=out)
+                self.assertIn(f'Картинок: 1, миниатюр: '
+                              f'{len(thumbnail_variants(500))}, '
+                              'ошибок: 0', out.getvalue())
+                geometry, options = thumbnail_variants()[0]
+                thumbnail = get_thumbnail(post.image.name, geometry,
+                                          **options)
+                self.assertTrue(thumbnail.exists())
+
+
+class TestImageNormalization(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='TestUser',
+            email='test@user.com',
+            password='12345'
+        )
+        self.client.force_login(self.user)
+        cache.clear()
+
+    @override_settings(POSTS_IMAGE_MAX_SIZE=1000)
+    def test_upload_downscaled_and_stripped(self):
+        byte_image = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0110] = 'Secret Phone'
+        Image.new('RGB', size=(2000, 800)).save(byte_image, format='jpeg',
+                                                exif=exif.tobytes())
+        byte_image.seek(0)
+        self.assertIn('exif', Image.open(byte_image).info)
+        byte_image.seek(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(MEDIA_ROOT=tmp):
+                response = self.client.post(
+                    reverse('new_post'),
+                    data={'text': 'post with image',
+                          'image': ContentFile(byte_image.read(),
+                                               name='photo.jpeg')},
+                    follow=True)
+                post = Post.objects.get()
+                self.assertTrue(post.image.name.endswith('.jpg'))
+                self.assertEqual((post.image_width, post.image_height),
+                                 (1000, 400))
+                with Image.open(post.image.path) as stored:
+                    self.assertEqual(stored.format, 'JPEG')
+                    self.assertTrue(stored.info.get('progressive'))
+                    self.assertNotIn('exif', stored.info)
+                self.assertContains(response, 'srcset=')
+                self.assertContains(response, ' 480w')
+                self.assertNotContains(response, ' 1920w')
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='TestUser',
+            email='test@user.com',
+            password='12345'
+        )
+        self.post = Post.objects.create(
+            text='Кошки <b>любят</b> молоко', author=self.user)
+        Post.objects.create(text='Собаки любят кости', author=self.user)
+
+    def test_search_ranked_with_snippet(self):
+        response = self.client.get(reverse('search'), {'q': 'кошк'})
+        results = response.context['results']
+        self.assertEqual([result.post for result in results], [self.post])
+        self.assertContains(response, '<mark>Кошки</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.text = 'Совы не то, чем кажутся'
+        self.post.save()
+        self.assertFalse(search_posts('кошки'))
+        self.assertEqual(len(search_posts('совы')), 1)
+        self.post.delete()
+        self.assertFalse(search_posts('совы'))
+        self.assertEqual(len(search_posts('любят')), 1)
+
+    def test_query_syntax_is_not_interpreted(self):
+        response = self.client.get(reverse('search'),
+                                   {'q': '"любят" OR NEAR( *'})
+        self.assertEqual(response.status_code, 200)
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(search_posts('любят')), 2)
+
+
+class TestApi(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='TestUser',
+            email='test@user.com',
+            password='12345'
+        )
+        self.group = Group.objects.create(
+            title='group',
+            slug='group',
+            description='test group'
+        )
+        self.posts = [
+            Post.objects.create(text=f'post {i}', group=self.group,
+                                author=self.user)
+            for i in range(5)
+        ]
+        Comment.objects.create(post=self.posts[0], author=self.user,
+                               text='test comment')
+
+    def get_json(self, url, data=None):
+        response = self.client.get(url, data)
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        return response, json.loads(content.decode())
+
+    def test_post_list_cursor(self):
+        response, data = self.get_json(reverse('api_posts'), {'limit': 3})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual([post['text'] for post in data['results']],
+                         ['post 4', 'post 3', 'post 2'])
+        self.assertIsNone(data['previous'])
+        _, data = self.get_json(data['next'])
+        self.assertEqual([post['id'] for post in data['results']],
+                         [self.posts[1].id, self.posts[0].id])
+        self.assertIsNone(data['next'])
+
+    def test_sparse_fields(self):
+        _, data = self.get_json(
+            reverse('api_post', args=[self.posts[0].id]),
+            {'fields': 'id,comments_count'})
+        self.assertEqual(data, {'id': self.posts[0].id, 'comments_count': 1})
+        response, data = self.get_json(reverse('api_group_posts',
+                                               args=['group']),
+                                       {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_constant_queries(self):
+        url = reverse('api_user_posts', args=[self.user.username])
+        with CaptureQueriesContext(connection) as few:
+            self.get_json(url, {'limit': 2})
+        with CaptureQueriesContext(connection) as many:
+            self.get_json(url, {'limit': 5})
+        self.assertEqual(len(few), len(many))
+
+    def test_errors(self):
+        response, data = self.get_json(reverse('api_post', args=[999]))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', data)
+        response, _ = self.get_json(reverse('api_follow'))
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post(reverse('api_posts'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_comments_and_user(self):
+        _, data = self.get_json(
+            reverse('api_post_comments', args=[self.posts[0].id]))
+        self.assertEqual(data['results'][0]['text'], 'test comment')
+        _, data = self.get_json(reverse('api_user',
+                                        args=[self.user.username]))
+        self.assertEqual(data['posts_count'], 5)
+
+    def test_archived_posts(self):
+        # API читает архив так же, как HTML-страницы
+        Post.objects.filter(pk=self.posts[0].pk).update(
+            pub_date=timezone.now() - dt.timedelta(days=400))
+        call_command('archive_posts', stdout=io.StringIO())
+        post_id = self.posts[0].id
+        response, data = self.get_json(reverse('api_post', args=[post_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['text'], 'post 0')
+        _, data = self.get_json(reverse('api_post_comments', args=[post_id]))
+        self.assertEqual(data['results'][0]['text'], 'test comment')
+        _, data = self.get_json(reverse('api_user_posts',
+                                        args=[self.user.username]),
+                                {'limit': 3})
+        _, data = self.get_json(data['next'])
+        self.assertEqual([post['text'] for post in data['results']],
+                         ['post 1', 'post 0'])
+
+
+class TestImport(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.author = User.objects.create_user(username='author',
+                                               password='12345')
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_import(self, *args):
+        out, self.errors = io.StringIO(), io.StringIO()
+        with override_settings(MEDIA_ROOT=self.tmp.name):
+            call_command('import_posts', *args, '--batch-size', '2',
+                         '--media-dir', self.tmp.name, stdout=out,
+                         stderr=self.errors)
+        return out.getvalue()
+
+    def test_import_keeps_dates_and_updates_derived_data(self):
+        Image.new('RGB', (300, 200)).save(
+            os.path.join(self.tmp.name, 'source.png'))
+        follows = self.write('follows.csv', ['user,author',
+                                             'reader,author'])
+        self.run_import('follows', follows)
+        posts = self.write('posts.jsonl', [json.dumps(record) for record in [
+            {'id': 100, 'author': 'author', 'text': 'old post',
+             'pub_date': '2010-05-01T12:00:00', 'group': 'imported'},
+            {'id': 101, 'author': 'author', 'text': 'with image',
+             'pub_date': '2011-05-01T12:00:00+00:00',
+             'image': 'source.png'},
+            {'id': 102, 'author': 'newcomer', 'text': 'third'},
+        ]])
+        output = self.run_import('posts', posts)
+        self.assertIn('Импортировано: 3', output)
+        # повторный прогон: все строки уже есть, база их пропускает
+        output = self.run_import('posts', posts)
+        self.assertIn('Импортировано: 0, пропущено: 3', output)
+        output = self.run_import('follows', follows)
+        self.assertIn('Импортировано: 0, пропущено: 1', output)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.pub_date.year, 2010)
+        self.assertEqual(post.group.slug, 'imported')
+        image = Post.objects.get(pk=101)
+        self.assertTrue(image.image.name.endswith('.jpg'))
+        self.assertEqual((image.image_width, image.image_height), (300, 200))
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count,
+                         2)
+        reader = User.objects.get(username='reader')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=reader).count(), 2)
+        # свежий пост попал в популярное, посты 2010 года – уже нет
+        self.assertEqual(
+            list(PostScore.objects.values_list('post_id', flat=True)), [102])
+        # новые посты получают id после импортированных
+        self.assertGreater(Post.objects.create(
+            text='new', author=self.author).pk, 102)
+
+        comments = self.write('comments.jsonl', [
+            json.dumps({'post': 100, 'author': 'reader', 'text': 'hi',
+                        'created': '2010-05-02T12:00:00'}),
+            json.dumps({'post': 999, 'author': 'reader', 'text': 'lost'}),
+        ])
+        output = self.run_import('comments', comments)
+        self.assertIn('пропущено: 1', output)
+        self.assertEqual(Post.objects.get(pk=100).comments_count, 1)
+        self.assertEqual(Comment.objects.get().created.year, 2010)
+
+    def test_resume_from_checkpoint(self):
+        posts = self.write('posts.jsonl', [
+            json.dumps({'author': 'author', 'text': f'post {i}'})
+            for i in range(5)
+        ])
+        ImportCheckpoint.objects.create(name=os.path.abspath(posts), done=3)
+        output = self.run_import('posts', posts)
+        self.assertIn('Продолжаем с записи 3', output)
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['post 3', 'post 4'])
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_checkpoint_rolls_back_with_chunk(self):
+        posts = self.write('posts.jsonl', [
+            json.dumps({'author': 'author', 'text': f'post {i}'})
+            for i in range(5)
+        ])
+        calls = []
+
+        def fail_second(command, chunk):
+            calls.append(chunk)
+            if len(calls) == 2:
+                raise RuntimeError('сбой')
+            return original(command, chunk)
+
+        original = import_posts.Command.import_posts
+        with mock.patch.object(import_posts.Command, 'import_posts',
+                               fail_second):
+            with self.assertRaises(RuntimeError):
+                self.run_import('posts', posts)
+        # вторая пачка откатилась вместе с отметкой о ней
+        self.assertEqual(ImportCheckpoint.objects.get().done, 2)
+        self.assertEqual(Post.objects.count(), 2)
+        output = self.run_import('posts', posts)
+        self.assertIn('Продолжаем с записи 2', output)
+        self.assertEqual(Post.objects.count(), 5)
+
+    def test_bad_records_are_skipped(self):
+        posts = self.write('posts.jsonl', [
+            json.dumps({'author': 'author', 'text': 'good'}),
+            '{"author": "author", "text": ',
+            json.dumps({'text': 'no author'}),
+            json.dumps({'author': 'author', 'text': 'bad id', 'id': 'x'}),
+            json.dumps({'author': 'author', 'text': 'bad date',
+                        'pub_date': 'вчера'}),
+            json.dumps(['not', 'a', 'record']),
+            json.dumps({'author': 'author', 'text': 'also good'}),
+        ])
+        output = self.run_import('posts', posts)
+        self.assertIn('Импортировано: 2, пропущено: 0, с ошибками: 5',
+                      output)
+        for number in range(2, 7):
+            self.assertIn(f'Запись {number} пропущена', self.errors.getvalue())
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['also good', 'good'])
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='TestUser',
+                                             password='12345')
+        self.other = User.objects.create_user(username='other',
+                                              password='12345')
+
+    def test_export_zip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(MEDIA_ROOT=tmp, EXPORT_CHUNK_SIZE=2):
+                byte_image = io.BytesIO()
+                Image.new('RGB', (50, 50)).save(byte_image, format='jpeg')
+                post = Post.objects.create(
+                    text='с картинкой', author=self.user,
+                    image=ContentFile(byte_image.getvalue(), name='a.jpg'))
+                for i in range(4):
+                    Post.objects.create(text=f'post {i}', author=self.user)
+                Post.objects.create(text='чужой', author=self.other)
+                Comment.objects.create(post=post, author=self.user,
+                                       text='мой комментарий')
+                self.client.force_login(self.user)
+                response = self.client.get(reverse('export'))
+                self.assertTrue(response.streaming)
+                self.assertIn('yatube-TestUser.zip',
+                              response['Content-Disposition'])
+                content = b''.join(response.streaming_content)
+
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertIsNone(archive.testzip())
+        posts = json.loads(archive.read('posts.json'))
+        self.assertEqual(len(posts), 5)
+        self.assertEqual(posts[0]['text'], 'с картинкой')
+        self.assertEqual(archive.read(posts[0]['image_file']),
+                         byte_image.getvalue())
+        comments = json.loads(archive.read('comments.json'))
+        self.assertEqual([c['text'] for c in comments], ['мой комментарий'])
+
+    def test_export_includes_archive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(MEDIA_ROOT=tmp):
+                byte_image = io.BytesIO()
+                Image.new('RGB', (50, 50)).save(byte_image, format='jpeg')
+                old = Post.objects.create(
+                    text='старый', author=self.user,
+                    image=ContentFile(byte_image.getvalue(), name='a.jpg'))
+                Post.objects.filter(pk=old.pk).update(
+                    pub_date=timezone.now() - dt.timedelta(days=400))
+                Comment.objects.create(post=old, author=self.user,
+                                       text='старый комментарий')
+                Post.objects.create(text='новый', author=self.user)
+                call_command('archive_posts', stdout=io.StringIO())
+                self.assertTrue(
+                    ArchivedPost.objects.filter(pk=old.pk).exists())
+                self.client.force_login(self.user)
+                content = b''.join(
+                    self.client.get(reverse('export')).streaming_content)
+
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        posts = json.loads(archive.read('posts.json'))
+        self.assertEqual([(p['text'], p['archived']) for p in posts],
+                         [('старый', True), ('новый', False)])
+        self.assertEqual(archive.read(posts[0]['image_file']),
+                         byte_image.getvalue())
+        comments = json.loads(archive.read('comments.json'))
+        self.assertEqual([c['text'] for c in comments],
+                         ['старый комментарий'])
+
+    def test_export_requires_login(self):
+        response = self.client.get(reverse('export'))
+        self.assertEqual(response.status_code, 302)
+
+
+class TestBenchmark(TestCase):
+    def setUp(self):
+        # как в django.test.Client: иначе WSGI-приложение закроет
+        # соединение посреди тестовой транзакции
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+    def test_seed_and_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(MEDIA_ROOT=tmp):
+                call_command('seed_data', '--users', '30', '--groups', '3',
+                             '--posts', '120', '--comments', '200',
+                             '--follows', '5', '--image-ratio', '0.3',
+                             stdout=io.StringIO())
+                self.assertEqual(
+                    User.objects.filter(username__startswith='seed').count(),
+                    30)
+                self.assertEqual(Post.objects.count(), 120)
+                self.assertEqual(Comment.objects.count(), 200)
+                self.assertTrue(Post.objects.exclude(image='').exists())
+                # степенной закон: у самого популярного заметно больше
+                # подписчиков, чем в среднем
+                top = UserStats.objects.order_by('-followers_count')[0]
+                self.assertGreater(top.followers_count,
+                                   Follow.objects.count() / 30)
+                self.assertEqual(
+                    sum(UserStats.objects.values_list('posts_count',
+                                                      flat=True)), 120)
+
+                output = os.path.join(tmp, 'result.json')
+                call_command('benchmark', '--requests', '5',
+                             '--concurrency', '1', '--output', output,
+                             stdout=io.StringIO())
+                with open(output) as source:
+                    report = json.load(source)
+        self.assertEqual(set(report['views']), {
+            'index', 'group_posts', 'profile', 'post_view',
+            'follow_index', 'add_comment'})
+        for result in report['views'].values():
+            self.assertEqual(result['errors'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(Comment.objects.count(), 205)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='TestUser',
+                                             password='12345')
+        Post.objects.create(text='Test post', author=self.user)
+        cache.clear()
+        registry.reset()
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('yatube_requests_total{view="index",status="200"} 2',
+                      text)
+        self.assertIn('yatube_cache_requests_total{view="index",'
+                      'cache="page",result="hit"} 1', text)
+        self.assertIn('yatube_cache_requests_total{view="index",'
+                      'cache="card",result="miss"} 1', text)
+        self.assertIn('yatube_sql_queries_count{view="index"} 2', text)
+        self.assertIn('yatube_template_seconds_total{view="index"}', text)
+        response = self.client.get(reverse('metrics'),
+                                   REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_metrics_summed_across_processes(self):
+        self.client.get(reverse('index'))
+        # второй воркер со своим реестром и своим номером в кэше
+        other = Registry()
+        other.record('index', 200, 0.02, RequestStats(), False)
+        other.record('index', 404, 0.02, RequestStats(), True)
+        other.flush(force=True)
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('yatube_requests_total{view="index",status="200"} 2',
+                      text)
+        self.assertIn('yatube_requests_total{view="index",status="404"} 1',
+                      text)
+        self.assertIn('yatube_over_budget_total{view="index"} 1', text)
+        self.assertIn('yatube_request_duration_seconds_count{view="index"} '
+                      '3', text)
+
+    def test_metrics_access(self):
+        url = reverse('metrics')
+        # локальный прокси, о котором не знают настройки
+        response = self.client.get(url, HTTP_X_FORWARDED_FOR='8.8.8.8')
+        self.assertEqual(response.status_code, 403)
+        with override_settings(TRUSTED_PROXIES=['127.0.0.1']):
+            response = self.client.get(url, HTTP_X_FORWARDED_FOR='8.8.8.8')
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(url,
+                                       HTTP_X_FORWARDED_FOR='127.0.0.1')
+            self.assertEqual(response.status_code, 200)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(url).status_code, 403)
+            response = self.client.get(url, REMOTE_ADDR='10.0.0.1',
+                                       HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_QUERY_BUDGET=0)
+    def test_over_budget_logged(self):
+        with self.assertLogs('yatube.metrics', 'WARNING') as logs:
+            self.client.get(reverse('profile', args=['TestUser']))
+        self.assertIn('(profile)', logs.output[0])
+        self.assertIn('FROM "posts_post"', logs.output[0])
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) "
+                        "AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?')
+
+
+class TestTwoTierCache(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        params = {'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 2,
+            'INVALIDATION_INTERVAL': 0,
+            'SHARED_ONLY_PREFIXES': ['lock:'],
+        }}
+        # два "воркера" над одним общим каталогом
+        self.first = TwoTierCache(tmp.name, params)
+        self.second = TwoTierCache(tmp.name, params)
+
+    def test_tiers(self):
+        self.first.set('key', {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertIsNone(self.second.get('missing'))
+        stats = self.second.stats()
+        self.assertEqual((stats['shared'], stats['local'], stats['miss']),
+                         (1, 1, 1))
+        self.assertEqual(self.first.get_many(['key', 'missing']),
+                         {'key': {'value': 1}})
+
+    def test_cross_process_invalidation(self):
+        self.first.set('key', 1)
+        self.assertEqual(self.second.get('key'), 1)
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+        self.second.set('key', 2)
+        self.first.clear()
+        self.assertIsNone(self.second.get('key'))
+
+    def test_local_lru_is_bounded(self):
+        for number in range(5):
+            self.first.set(f'key{number}', number)
+        self.assertEqual(self.first.stats()['local_entries'], 2)
+        self.assertEqual(self.first.get('key0'), 0)
+
+    def test_shared_only_keys(self):
+        self.assertTrue(self.first.add('lock:page', 1))
+        self.assertFalse(self.second.add('lock:page', 1))
+        self.assertEqual(self.first.stats()['local_entries'], 0)
+        self.second.delete('lock:page')
+        self.assertTrue(self.first.add('lock:page', 1))
+
+    def test_shared_add_and_incr_are_atomic(self):
+        shared = LockedFileBasedCache(self.first.shared._dir, {})
+        shared.set('counter', 0, 60)
+        added = []
+
+        def work():
+            # у каждого потока своё открытие файлов блокировок, как у
+            # отдельного процесса
+            cache = LockedFileBasedCache(shared._dir, {})
+            added.append(cache.add('lock', 1))
+            for _ in range(50):
+                cache.incr('counter')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(shared.get('counter'), 400)
+        self.assertEqual(added.count(True), 1)
+        # incr() не сбрасывает срок хранения на TIMEOUT по умолчанию
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(shared.get('counter'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class TestReplicaRouting(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def view(self, write=False):
+        def view(request):
+            if write:
+                db_router.db_for_write(Post)
+            return HttpResponse(db_router.db_for_read(Post))
+        return PrimaryPinMiddleware(view)
+
+    def test_reads_go_to_replica_until_write(self):
+        response = self.view()(self.factory.get('/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+        response = self.view(write=True)(self.factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        pin = response.cookies[settings.REPLICA_PIN_COOKIE]
+
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = pin.value
+        self.assertEqual(self.view()(request).content, b'default')
+
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = str(
+            int(time.time()) - 1)
+        self.assertEqual(self.view()(request).content, b'replica')
+
+    def test_fresh_pages_not_cached_with_replicas(self):
+        user = User.objects.create_user(username='TestUser')
+        Post.objects.create(text='Test post', author=user)
+        client = Client()
+        # читаем из основной базы: реплики в тестах нет
+        client.cookies[settings.REPLICA_PIN_COOKIE] = str(
+            int(time.time()) + 60)
+        with mock.patch('posts.views.feeds.index_feed',
+                        wraps=feeds.index_feed) as index_feed:
+            client.get(reverse('index'))
+            client.get(reverse('index'))
+        self.assertEqual(index_feed.call_count, 2)
+
+    def test_fresh_pages_not_validated_with_replicas(self):
+        user = User.objects.create_user(username='TestUser')
+        Post.objects.create(text='Test post', author=user)
+        client = Client()
+        client.cookies[settings.REPLICA_PIN_COOKIE] = str(
+            int(time.time()) + 60)
+        response = client.get(reverse('index'))
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        # окно отставания реплики прошло – страница снова с валидаторами
+        with mock.patch('posts.cache.time.time_ns',
+                        return_value=time.time_ns() + 10 ** 12):
+            response = client.get(reverse('index'))
+        self.assertIn('ETag', response)
+
+    def test_primary_outside_requests(self):
+        self.assertEqual(db_router.db_for_read(Post), 'default')
+        self.assertFalse(db_router.allow_migrate('replica', 'posts'))
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='TestUser',
+                                             password='12345')
+        self.reader = User.objects.create_user(username='reader',
+                                               password='12345')
+        Follow.objects.create(user=self.reader, author=self.user)
+        now = timezone.now()
+        self.posts = []
+        for i in range(8):
+            post = Post.objects.create(text=f'post {i}', author=self.user)
+            # посты 0–3 старше года
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=now - dt.timedelta(days=700 - 100 * i))
+            self.posts.append(post)
+        Comment.objects.create(post=self.posts[0], author=self.reader,
+                               text='старый комментарий')
+        timeline.backfill(self.reader, self.user)
+
+    def archive(self):
+        call_command('archive_posts', '--batch-size', '3',
+                     stdout=io.StringIO())
+
+    def test_archive_moves_old_posts(self):
+        self.archive()
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertEqual(ArchivedPost.objects.count(), 4)
+        self.assertFalse(Comment.objects.exists())
+        archived = ArchivedPost.objects.get(pk=self.posts[0].pk)
+        self.assertEqual(archived.comments.get().text, 'старый комментарий')
+        self.assertEqual(archived.comments_count, 1)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader).count(), 4)
+        self.assertEqual(UserStats.objects.get(user=self.user).posts_count,
+                         8)
+        out = io.StringIO()
+        call_command('rebuild_counters', '--dry-run', stdout=out)
+        self.assertIn('пользователи – 0, посты – 0', out.getvalue())
+
+    def test_archived_posts_readable(self):
+        self.archive()
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('post', args=['TestUser', self.posts[0].pk]))
+        self.assertContains(response, 'post 0')
+        self.assertContains(response, 'старый комментарий')
+        self.assertNotContains(response, 'Редактировать')
+
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse('profile', args=['TestUser']),
+                                       {'cursor': cursor} if cursor else {})
+            page = response.context['page']
+            seen += [post.text for post in page]
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [f'post {i}' for i in reversed(range(8))])
+        response = self.client.get(reverse('profile', args=['TestUser']),
+                                   {'cursor': page.previous_cursor})
+        self.assertEqual([post.text for post in response.context['page']],
+                         ['post 7', 'post 6', 'post 5', 'post 4', 'post 3'])
+
+
+@override_settings(POSTS_COMMENTS_PER_PAGE=5)
+class TestCommentPages(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='TestUser',
+                                             password='12345')
+        self.post = Post.objects.create(text='Test post', author=self.user)
+        self.url = reverse('post', args=['TestUser', self.post.id])
+
+    def add_comments(self, count):
+        start = Comment.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create_user(username=f'commenter{i}')
+            Comment.objects.create(post=self.post, author=author,
+                                   text=f'comment {i}')
+
+    def count_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        return len(queries)
+
+    def test_constant_queries(self):
+        self.add_comments(2)
+        few = self.count_queries()
+        self.add_comments(10)
+        self.assertEqual(self.count_queries(), few)
+
+    def test_comment_pages(self):
+        self.add_comments(12)
+        response = self.client.get(self.url)
+        page = response.context['comments']
+        self.assertEqual([c.text for c in page],
+                         [f'comment {i}' for i in range(5)])
+        self.assertContains(response, 'comments-more')
+        texts = []
+        cursor = page.next_cursor
+        while cursor:
+            response = self.client.get(
+                reverse('post_comments', args=['TestUser', self.post.id]),
+                {'cursor': cursor})
+            page = response.context['comments']
+            texts += [c.text for c in page]
+            cursor = page.next_cursor
+        self.assertEqual(texts, [f'comment {i}' for i in range(5, 12)])
+        self.assertNotContains(response, 'comments-more')
+
+
+class TestTrending(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='TestUser',
+                                             password='12345')
+        self.group = Group.objects.create(title='Test group',
+                                          slug='test-group')
+        self.posts = [Post.objects.create(text=f'post {i}', author=self.user)
+                      for i in range(3)]
+
+    def comment(self, post):
+        Comment.objects.create(post=post, author=self.user, text='comment')
+
+    def test_comments_raise_post(self):
+        self.comment(self.posts[0])
+        self.comment(self.posts[0])
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(response.context['posts'][0], self.posts[0])
+        self.assertEqual(len(response.context['posts']), 3)
+
+    def test_old_events_decay(self):
+        old = timezone.now() - dt.timedelta(days=5)
+        Post.objects.filter(pk=self.posts[0].pk).update(pub_date=old)
+        for _ in range(10):
+            self.comment(self.posts[0])
+        Comment.objects.update(created=old)
+        trending.rebuild()
+        # десять комментариев пятидневной давности весят меньше свежего поста
+        self.assertEqual(trending.top(3)[-1], self.posts[0])
+        later = timezone.now() + dt.timedelta(days=7)
+        self.assertEqual(trending.compact(later), 1)
+        self.assertNotIn(self.posts[0], trending.top(3))
+
+    def test_incremental_matches_rebuild(self):
+        for post in self.posts[:2]:
+            self.comment(post)
+        self.comment(self.posts[1])
+        incremental = dict(PostScore.objects.values_list('post_id', 'score'))
+        trending.rebuild()
+        rebuilt = dict(PostScore.objects.values_list('post_id', 'score'))
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for post_id, score in rebuilt.items():
+            self.assertAlmostEqual(incremental[post_id], score, places=6)
+
+    def test_group_trending(self):
+        post = self.posts[1]
+        post.group = self.group
+        post.save()
+        response = self.client.get(reverse('group_trending',
+                                           args=['test-group']))
+        self.assertEqual(list(response.context['posts']), [post])
+
+    def test_constant_queries(self):
+        def count():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('trending'))
+            return len(queries)
+
+        few = count()
+        for i in range(10):
+            Post.objects.create(text=f'more {i}', author=self.user)
+        self.assertEqual(count(), few)
+
+    def test_archived_post_leaves_trending(self):
+        Post.objects.filter(pk=self.posts[0].pk).update(
+            pub_date=timezone.now() - dt.timedelta(days=400))
+        call_command('archive_posts', stdout=io.StringIO())
+        self.assertFalse(PostScore.objects.filter(
+            post_id=self.posts[0].pk).exists())
+        self.assertNotIn(self.posts[0], trending.top(3))
+
+
+class TestImageStorage(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='TestUser',
+                                             password='12345')
+        self.client.force_login(self.user)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.media = override_settings(MEDIA_ROOT=self.tmp.name)
+        self.media.enable()
+        # файлы удаляются после коммита, а TestCase его не делает; патч
+        # общий для всего transaction, поэтому миниатюры не заказываем
+        # вовсе – иначе фоновый поток допишет их уже после отката MEDIA_ROOT
+        self.on_commit = mock.patch('posts.blobs.transaction.on_commit',
+                                    lambda callback: callback())
+        self.on_commit.start()
+        self.schedule = mock.patch('posts.thumbnails.schedule')
+        self.schedule.start()
+
+    def tearDown(self):
+        self.schedule.stop()
+        self.on_commit.stop()
+        self.media.disable()
+        self.tmp.cleanup()
+
+    def upload(self, color, name='meme.png', post=None):
+        byte_image = io.BytesIO()
+        Image.new('RGB', size=(300, 200), color=color).save(byte_image,
+                                                             format='png')
+        data = {'text': 'post with image',
+                'image': ContentFile(byte_image.getvalue(), name=name)}
+        if post is None:
+            self.client.post(reverse('new_post'), data=data)
+            return Post.objects.latest('id')
+        self.client.post(reverse('post_edit',
+                                 args=['TestUser', post.id]), data=data)
+        post.refresh_from_db()
+        return post
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.tmp.name)
+            for root, _, names in os.walk(os.path.join(self.tmp.name,
+                                                       'posts'))
+            for name in names)
+
+    def test_same_content_stored_once(self):
+        first = self.upload((255, 0, 0), 'one.png')
+        second = self.upload((255, 0, 0), 'two.png')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}'
+                                           r'\.jpg$')
+        self.assertEqual(self.files(), [first.image.name])
+        self.assertEqual(ImageBlob.objects.get(name=first.image.name).refs, 2)
+
+    def test_edit_releases_old_image(self):
+        shared = self.upload((0, 255, 0))
+        post = self.upload((0, 255, 0))
+        old = post.image.name
+        post = self.upload((0, 0, 255), post=post)
+        self.assertNotEqual(post.image.name, old)
+        self.assertEqual(ImageBlob.objects.get(name=old).refs, 1)
+        shared.delete()
+        self.assertFalse(ImageBlob.objects.filter(name=old).exists())
+        self.assertEqual(self.files(), [post.image.name])
+
+    def test_archived_post_keeps_image(self):
+        post = self.upload((10, 20, 30))
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=timezone.now() - dt.timedelta(days=400))
+        call_command('archive_posts', stdout=io.StringIO())
+        self.assertEqual(ImageBlob.objects.get(name=post.image.name).refs, 1)
+        self.assertEqual(blobs.rebuild(), 1)
+        ArchivedPost.objects.get(pk=post.pk).delete()
+        self.assertEqual(self.files(), [])
+
+
+class TestWarmup(TestCase):
+    def setUp(self):
+        # как в TestBenchmark: страницы запрашиваются через WSGI
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+    def test_warmup_command(self):
+        user = User.objects.create_user(username='TestUser')
+        Post.objects.create(text='Test post', author=user)
+        out = io.StringIO()
+        call_command('warmup', stdout=out)
+        report = out.getvalue()
+        self.assertIn('с ошибками – 0', report)
+        self.assertIn('/ 200', report)
+        self.assertIn('/trending/ 200', report)
+        # главная уже в кэше страниц
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertLessEqual(len(queries), 2)
+
+    def test_production_profile(self):
+        with mock.patch.dict(os.environ, {'YATUBE_SECRET_KEY': 'secret'}):
+            production = importlib.import_module(
+                'yatube.settings.production')
+        self.assertFalse(production.DEBUG)
+        self.assertEqual(production.SECRET_KEY, 'secret')
+        self.assertNotIn('debug_toolbar', production.INSTALLED_APPS)
+        self.assertGreater(production.DATABASES['default']['CONN_MAX_AGE'],
+                           0)
+        options = production.TEMPLATES[0]['OPTIONS']
+        self.assertEqual(options['loaders'][0][0],
+                         'django.template.loaders.cached.Loader')
+        # профиль не меняет общие настройки, на которых идут тесты
+        self.assertTrue(settings.TEMPLATES[0]['APP_DIRS'])
+        self.assertEqual(settings.DATABASES['default']['CONN_MAX_AGE'], 0)
+
+
+@override_settings(RATELIMITS={'add_comment': {'user': '2/m', 'ip': '5/m'}})
+class TestRateLimit(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='TestUser',
+                                             password='12345')
+        self.post = Post.objects.create(text='Test post', author=self.user)
+        self.url = reverse('add_comment', args=['TestUser', self.post.id])
+
+    def comment(self, user, **extra):
+        self.client.force_login(user)
+        return self.client.post(self.url, {'text': 'comment'}, **extra)
+
+    def test_bucket_refills(self):
+        now = time.time()
+        key = 'ratelimit:test:user:1'
+        self.assertEqual(ratelimit.take(key, '2/m', now), 0)
+        self.assertEqual(ratelimit.take(key, '2/m', now), 0)
+        self.assertAlmostEqual(ratelimit.take(key, '2/m', now), 30, 0)
+        # через полминуты вернулся один токен
+        self.assertEqual(ratelimit.take(key, '2/m', now + 30), 0)
+        self.assertGreater(ratelimit.take(key, '2/m', now + 30), 0)
+
+    def test_bucket_outlives_default_timeout(self):
+        key = 'ratelimit:test:ip:127.0.0.1'
+        self.assertEqual(ratelimit.take(key, '10/h'), 0)
+        self.assertEqual(ratelimit.take(key, '10/h'), 0)
+        # incr() не сбросил срок хранения на TIMEOUT по умолчанию (300 с):
+        # корзина живёт весь период лимита
+        with mock.patch('time.time', return_value=time.time() + 301):
+            self.assertIsNotNone(cache.get(key))
+        with mock.patch('time.time', return_value=time.time() + 3602):
+            self.assertIsNone(cache.get(key))
+
+    def test_empty_bucket_kept_until_refilled(self):
+        key = 'ratelimit:test:ip:127.0.0.2'
+        started = time.time()
+
+        def take_at(offset):
+            with mock.patch('time.time', return_value=started + offset):
+                return ratelimit.take(key, '10/h')
+
+        self.assertEqual([take_at(0) for _ in range(10)], [0] * 10)
+        # через 50 минут вернулось 8 токенов, корзина снова пуста
+        self.assertEqual([take_at(3000) for _ in range(8)], [0] * 8)
+        self.assertGreater(take_at(3000), 0)
+        # час после создания корзины: ключ жив, вернулось два токена
+        allowed = [take_at(3700) == 0 for _ in range(3)]
+        self.assertEqual(allowed, [True, True, False])
+
+    def test_client_ip_behind_proxy(self):
+        factory = RequestFactory()
+        request = factory.get('/', REMOTE_ADDR='10.0.0.1',
+                              HTTP_X_FORWARDED_FOR='1.2.3.4, 5.6.7.8')
+        # без доверенных прокси заголовок подделывается кем угодно
+        self.assertEqual(ratelimit.client_ip(request), '10.0.0.1')
+        with override_settings(TRUSTED_PROXIES=['10.0.0.0/8']):
+            self.assertEqual(ratelimit.client_ip(request), '5.6.7.8')
+        with override_settings(TRUSTED_PROXIES=['10.0.0.1', '5.6.7.8']):
+            self.assertEqual(ratelimit.client_ip(request), '1.2.3.4')
+        with override_settings(TRUSTED_PROXIES=['192.168.0.1']):
+            self.assertEqual(ratelimit.client_ip(request), '10.0.0.1')
+
+    def test_user_limited(self):
+        for _ in range(2):
+            self.assertEqual(self.comment(self.user).status_code, 302)
+        response = self.comment(self.user)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(Comment.objects.count(), 2)
+        # чтение не ограничено, у другого пользователя своя корзина
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        other = User.objects.create_user(username='other')
+        self.assertEqual(self.comment(other).status_code, 302)
+
+    def test_ip_limited(self):
+        for i in range(5):
+            user = User.objects.create_user(username=f'bot{i}')
+            self.assertEqual(self.comment(user).status_code, 302)
+        response = self.comment(self.user,
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('detail', response.json())
+        self.assertEqual(self.comment(self.user, REMOTE_ADDR='10.0.0.2')
+                         .status_code, 302)
+
+    def test_decorator(self):
+        @ratelimit.ratelimit(ip='1/h', methods=['GET'])
+        def view(request):
+            return HttpResponse('ok')
+
+        factory = RequestFactory()
+        self.assertEqual(view(factory.get('/')).status_code, 200)
+        response = view(factory.get('/'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3600')
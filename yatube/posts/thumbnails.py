@@ -0,0 +1,58 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from .images import thumbnail_variants
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def generate(name, width=None):
+    # те же геометрии и опции, что в шаблоне карточки: sorl найдёт готовую
+    # миниатюру по ключу и не будет ничего пересчитывать при показе
+    # миниатюре и ключу нужен тот же storage, что у Post.image
+    source = ImageFile(name, image_storage)
+    variants = thumbnail_variants(width)
+    for geometry, options in variants:
+        get_thumbnail(source, geometry, **options)
+    return len(variants)
+
+
+def _generate_in_background(name, width):
+    try:
+        generate(name, width)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры для %s', name)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POSTS_THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def schedule(name, width=None):
+    # после коммита, чтобы фоновый поток не опередил запись поста
+    transaction.on_commit(lambda: _get_executor().submit(
+        _generate_in_background, name, width))
+
+
+def init_worker():
+    # для процессов, запущенных через spawn, а не fork
+    if not apps.ready:
+        django.setup()
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.db.models import F
+
+from .counters import stats_for
+from .models import Follow, Post, TimelineEntry, UserStats
+
+
+def is_celebrity(author):
+    followers = stats_for(author).followers_count
+    return followers > settings.TIMELINE_FANOUT_LIMIT
+
+
+def _insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out(post):
+    # у авторов с огромным числом подписчиков пост не раскладывается по
+    # лентам, а подмешивается при чтении (см. timeline_posts)
+    if is_celebrity(post.author):
+        return
+    followers = Follow.objects.filter(
+        author=post.author).values_list('user_id', flat=True)
+    _insert(TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers.iterator())
+
+
+def backfill(user, author):
+    if is_celebrity(author):
+        return
+    posts = Post.objects.filter(author=author).values_list('id', 'pub_date')
+    _insert(TimelineEntry(user=user, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts.iterator())
+
+
+def refill(author_ids):
+    # для записей, созданных в обход сигналов (команда import_posts):
+    # раскладывает все посты авторов по лентам их подписчиков
+    author_ids = sorted(author_ids)
+    size = settings.TIMELINE_BATCH_SIZE
+    for start in range(0, len(author_ids), size):
+        authors = Follow.objects.filter(
+            author_id__in=author_ids[start:start + size],
+            author__stats__followers_count__lte=(
+                settings.TIMELINE_FANOUT_LIMIT),
+        ).values_list('author_id', flat=True).distinct()
+        for author_id in authors:
+            _refill_author(author_id)
+
+
+def _refill_author(author_id):
+    followers = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+    posts = Post.objects.filter(
+        author_id=author_id).values_list('id', 'pub_date')
+    _insert(TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts.iterator()
+            for user_id in followers)
+
+
+def followers_changed(author_id, created):
+    """
+    Вызывается после подписки (created) или отписки. Автор, только что
+    переступивший TIMELINE_FANOUT_LIMIT, перестаёт раскладываться по
+    лентам: его записи оттуда убираются, посты подмешиваются при чтении.
+    Вернувшийся под порог – раскладывается по лентам всех подписчиков
+    заново, иначе его посты пропали бы из их лент.
+    """
+    followers = (UserStats.objects.filter(user_id=author_id)
+                 .values_list('followers_count', flat=True).first())
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if created and followers == limit + 1:
+        TimelineEntry.objects.filter(post__author_id=author_id).delete()
+    elif not created and followers == limit:
+        _refill_author(author_id)
+
+
+def prune(user, author):
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+# Лента сортируется по полям записи ленты, а не поста: тогда страница
+# читается по индексу timeline_user_pub_date_idx без временной сортировки
+ORDERING = ('-feed_date', '-feed_id')
+
+
+def timeline_tiers(user, celebrities=None):
+    """
+    Лента подписок – несколько запросов с одним ключом сортировки
+    (ORDERING), которые сливает TieredCursorPaginator: записи ленты
+    пользователя и по запросу на каждую знаменитость из его подписок – её
+    посты по индексу автора. Так каждая страница читается по индексам, без
+    OR по двум таблицам и DISTINCT.
+    """
+    if celebrities is None:
+        celebrities = Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gt=(
+                settings.TIMELINE_FANOUT_LIMIT),
+        ).values_list('author_id', flat=True)
+    tiers = [Post.objects.filter(timeline_entries__user=user).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_id=F('timeline_entries__post_id'),
+    )]
+    for author_id in celebrities:
+        tiers.append(Post.objects.filter(author_id=author_id).annotate(
+            feed_date=F('pub_date'), feed_id=F('id')))
+    return tiers
@@ -0,0 +1,118 @@
+import datetime as dt
+import math
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .feeds import feed
+from .models import Comment, Post, PostScore
+
+# Вес события затухает вдвое за TRENDING_HALF_LIFE_HOURS. Вместо того чтобы
+# уменьшать все рейтинги со временем, новые события получают вес
+# exp((t - EPOCH) / tau): относительный порядок постов от этого не меняется,
+# а рейтинг хранится логарифмом, чтобы не переполниться.
+EPOCH = dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def _tau():
+    return settings.TRENDING_HALF_LIFE_HOURS * 60 * 60 / math.log(2)
+
+
+def event_score(when, weight):
+    return math.log(weight) + (when - EPOCH).total_seconds() / _tau()
+
+
+def logaddexp(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def record(post_id, when, weight):
+    event = event_score(when, weight)
+    with transaction.atomic():
+        row = (PostScore.objects.select_for_update()
+               .filter(post_id=post_id).values_list('score', flat=True)
+               .first())
+        if row is None:
+            group_id = (Post.objects.filter(pk=post_id)
+                        .values_list('group_id', flat=True).first())
+            try:
+                with transaction.atomic():
+                    PostScore.objects.create(post_id=post_id,
+                                             group_id=group_id, score=event)
+                return
+            except IntegrityError:
+                # строку успел создать параллельный запрос
+                row = (PostScore.objects.select_for_update()
+                       .values_list('score', flat=True).get(post_id=post_id))
+        PostScore.objects.filter(post_id=post_id).update(
+            score=logaddexp(row, event))
+
+
+def top(limit, group=None):
+    # K строк по индексу рейтинга и K постов по первичному ключу
+    scores = PostScore.objects.order_by('-score')
+    if group is not None:
+        scores = scores.filter(group=group)
+    ids = list(scores.values_list('post_id', flat=True)[:limit])
+    posts = feed().in_bulk(ids)
+    return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def floor(now=None):
+    # рейтинг поста, чей суммарный вес к моменту now упал до
+    # TRENDING_MIN_WEIGHT: ниже него пост в популярное уже не попадёт
+    return event_score(now or timezone.now(), settings.TRENDING_MIN_WEIGHT)
+
+
+def horizon(now=None):
+    # события старше этого момента весят меньше TRENDING_MIN_WEIGHT
+    seconds = -math.log(settings.TRENDING_MIN_WEIGHT) * _tau()
+    return (now or timezone.now()) - dt.timedelta(seconds=seconds)
+
+
+def compact(now=None):
+    deleted, _ = PostScore.objects.filter(score__lt=floor(now)).delete()
+    return deleted
+
+
+def compute(posts, comments, now=None):
+    """
+    Считает рейтинги заново по датам публикации и комментариев.
+    posts и comments – менеджеры моделей (в миграции – исторических).
+    """
+    since = horizon(now)
+    scores = {}
+    groups = {}
+    recent = posts.filter(pub_date__gte=since).values_list(
+        'id', 'group_id', 'pub_date')
+    for post_id, group_id, pub_date in recent.iterator():
+        scores[post_id] = event_score(pub_date,
+                                      settings.TRENDING_POST_WEIGHT)
+        groups[post_id] = group_id
+    commented = comments.filter(created__gte=since).values_list(
+        'post_id', 'created')
+    for post_id, created in commented.iterator():
+        event = event_score(created, settings.TRENDING_COMMENT_WEIGHT)
+        previous = scores.get(post_id)
+        scores[post_id] = (event if previous is None
+                           else logaddexp(previous, event))
+    missing = [post_id for post_id in scores if post_id not in groups]
+    for start in range(0, len(missing), 500):
+        groups.update(posts.filter(pk__in=missing[start:start + 500])
+                      .values_list('id', 'group_id'))
+    return [(post_id, groups.get(post_id), score)
+            for post_id, score in scores.items()]
+
+
+def rebuild(now=None):
+    rows = compute(Post.objects, Comment.objects.exclude(post=None), now)
+    with transaction.atomic():
+        PostScore.objects.all().delete()
+        PostScore.objects.bulk_create(
+            [PostScore(post_id=post_id, group_id=group_id, score=score)
+             for post_id, group_id, score in rows],
+            batch_size=500,
+        )
+    return len(rows)
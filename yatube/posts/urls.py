@@ -5,14 +5,21 @@ from . import views
 urlpatterns = [
     path('', views.index, name="index"),
     path("group/<slug:slug>/", views.group_posts, name="group"),
+    path("group/<slug:slug>/trending/", views.group_trending,
+         name="group_trending"),
+    path("trending/", views.trending_index, name="trending"),
     path("new/", views.new_post, name="new_post"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("search/", views.search, name="search"),
+    path("export/", views.export_data, name="export"),
     path("<str:username>/follow/", views.profile_follow,
          name="profile_follow"),
     path("<str:username>/unfollow/", views.profile_unfollow,
          name="profile_unfollow"),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
+    path('<str:username>/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
     path(
         '<str:username>/<int:post_id>/edit/',
         views.post_edit,
@@ -1,17 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import ensure_csrf_cookie
 from .models import Group, Post, User, Follow
 from .forms import PostForm, CommentForm
-from django.views.decorators.cache import cache_page
+from .paginator import CursorPaginator
+from . import export, feeds, follows, timeline, trending
+from .cache import cached_page
+from .counters import stats_for
+from .search import search as search_posts
 
 
-@cache_page(20, key_prefix='index_page')
+@cached_page(lambda: ['index'])
 def index(request):
-    post_list = Post.objects.select_related('author', "group")
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = feeds.index_feed()
+    paginator = CursorPaginator(post_list, 10)
+    page = paginator.get_page(request.GET.get('cursor'))
     return render(
         request,
         'index.html',
@@ -19,12 +24,12 @@ def index(request):
     )
 
 
+@cached_page(lambda slug: [f'group:{slug}'])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = feeds.group_feed(group)
+    paginator = CursorPaginator(posts, 5)
+    page = paginator.get_page(request.GET.get('cursor'))
     return render(
         request,
         "group.html",
@@ -32,6 +37,21 @@ def group_posts(request, slug):
     )
 
 
+# рейтинг меняется с каждым постом и комментарием, а они сдвигают версию
+# главной и группы
+@cached_page(lambda: ['index'], params=())
+def trending_index(request):
+    posts = trending.top(settings.TRENDING_SIZE)
+    return render(request, 'trending.html', {'posts': posts})
+
+
+@cached_page(lambda slug: [f'group:{slug}'], params=())
+def group_trending(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    posts = trending.top(settings.TRENDING_SIZE, group)
+    return render(request, 'trending.html', {'posts': posts, 'group': group})
+
+
 @login_required()
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -39,51 +59,74 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        timeline.fan_out(post)
         return redirect('/')
     return render(request, 'new.html', {'form': form})
 
 
+# кнопка подписки берёт токен из cookie: ставим его и на ответ из кэша
+@ensure_csrf_cookie
+@cached_page(lambda username: [f'profile:{username}'])
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    count = posts.count
-    paginator = Paginator(posts, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    follower = author.follower.all().count
-    following = author.following.all().count
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    tiers = feeds.profile_tiers(author)
+    paginator = feeds.paginator(tiers, 5)
+    page = paginator.get_page(request.GET.get('cursor'))
+    stats = stats_for(author)
     context = {
         'page': page,
-        'post': posts,
+        'post': tiers[0],
         "author": author,
         'paginator': paginator,
-        'count': count,
-        'follower': follower,
-        'following': following,
+        'count': stats.posts_count,
+        'follower': stats.following_count,
+        'following': stats.followers_count,
+        'is_following': request.user.is_authenticated and Follow.objects
+        .filter(user=request.user, author=author).exists(),
     }
     return render(request, "profile.html", context)
 
 
+@cached_page(lambda username, post_id: [f'post:{post_id}',
+                                        f'profile:{username}'],
+             params=())
 def post_view(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id, author=author)
-    comments = post.comments.all()
-    count = author.posts.all().count
-    follower = author.follower.all().count
-    following = author.following.all().count
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    post = feeds.find_post(post_id, author=author)
+    stats = stats_for(author)
     form_comment = CommentForm()
     context = {
         'post': post,
         'author': author,
-        'comments': comments,
-        'count': count,
-        'follower': follower,
-        'following': following,
+        'comments': _comments_page(post, None),
+        'count': stats.posts_count,
+        'follower': stats.following_count,
+        'following': stats.followers_count,
         'form_comment': form_comment,
     }
     return render(request, 'post.html', context)
 
 
+@cached_page(lambda username, post_id: [f'post:{post_id}'])
+def post_comments(request, username, post_id):
+    # следующие страницы комментариев подгружаются отдельно от поста
+    post = feeds.find_post(post_id, author__username=username)
+    context = {
+        'post': post,
+        'comments': _comments_page(post, request.GET.get('cursor')),
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
+def _comments_page(post, cursor):
+    paginator = CursorPaginator(post.comments.select_related('author'),
+                                settings.POSTS_COMMENTS_PER_PAGE,
+                                ordering=('created', 'id'))
+    return paginator.get_page(cursor)
+
+
 @login_required()
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, pk=post_id, author__username=username)
@@ -112,6 +155,35 @@ def add_comment(request, username, post_id):
     return render(request, 'comments.html', {'post': post, 'form': form})
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()[:200]
+    try:
+        page_number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page_number = 1
+    page_number = min(page_number, settings.POSTS_SEARCH_MAX_PAGES)
+    per_page = settings.POSTS_SEARCH_PER_PAGE
+    results = search_posts(query, per_page + 1,
+                           (page_number - 1) * per_page)
+    context = {
+        'query': query,
+        'results': results[:per_page],
+        'page_number': page_number,
+        'has_next': (len(results) > per_page
+                     and page_number < settings.POSTS_SEARCH_MAX_PAGES),
+    }
+    return render(request, 'search.html', context)
+
+
+@login_required
+def export_data(request):
+    response = StreamingHttpResponse(export.stream(request.user),
+                                     content_type='application/zip')
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export.filename(request.user)}"')
+    return response
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -127,30 +199,44 @@ def server_error(request):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator = feeds.paginator(feeds.follow_feed(request.user), 10,
+                                ordering=feeds.FOLLOW_ORDERING)
+    page = paginator.get_page(request.GET.get('cursor'))
     return render(request, 'follow.html',
                   {'page': page, 'paginator': paginator})
 
 
+def _follow_target(username):
+    # автор и число его подписчиков до клика – одним запросом
+    row = (User.objects.filter(username=username)
+           .values_list('pk', 'stats__followers_count').first())
+    if row is None:
+        raise Http404
+    return User(pk=row[0], username=username), row[1] or 0
+
+
+def _follow_response(request, username, following, followers_count):
+    # кнопка на странице профиля шлёт AJAX-запрос и перерисовки не ждёт
+    if request.is_ajax():
+        return JsonResponse({'following': following,
+                             'followers_count': followers_count})
+    return redirect("profile", username=username)
+
+
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if (request.user != author
-            and not Follow.objects.filter(user=request.user,
-                                          author=author).exists()):
-        follow = Follow()
-        follow.author = author
-        follow.user = request.user
-        follow.save()
-    return redirect("profile", username=username)
+    author, followers_count = _follow_target(username)
+    following = request.user != author
+    if following and follows.follow(request.user, author):
+        timeline.backfill(request.user, author)
+        followers_count += 1
+    return _follow_response(request, username, following, followers_count)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    un_follow = Follow.objects.get(user=request.user, author=author)
-    un_follow.delete()
-    return redirect("profile", username=username)
+    author, followers_count = _follow_target(username)
+    if follows.unfollow(request.user, author):
+        timeline.prune(request.user, author)
+        followers_count = max(followers_count - 1, 0)
+    return _follow_response(request, username, False, followers_count)
@@ -1,5 +1,8 @@
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+
+from .reserved import is_reserved
 
 
 User = get_user_model()
@@ -12,4 +15,11 @@ class CreationForm(UserCreationForm):
         # укажем модель, с которой связана создаваемая форма
         model = User
         # укажем, какие поля должны быть видны в форме и в каком порядке
-        fields = ("first_name", "last_name", "username", "email")
\ No newline at end of file
+        fields = ("first_name", "last_name", "username", "email")
+
+    def clean_username(self):
+        username = self.cleaned_data['username']
+        # имя не должно совпадать с адресом сайта вроде /search/
+        if is_reserved(username):
+            raise ValidationError('Это имя занято, выберите другое')
+        return username
@@ -0,0 +1,56 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.checks import Tags, Warning, register
+from django.urls import URLResolver, get_resolver
+
+
+@lru_cache(maxsize=None)
+def reserved_usernames():
+    """
+    Первые сегменты адресов сайта (search, export, api, ...). Эти маршруты
+    стоят раньше <username>/, поэтому пользователь с таким именем не
+    получил бы свой профиль.
+    """
+    names = set()
+
+    def collect(patterns, prefix=''):
+        for pattern in patterns:
+            route = prefix + str(pattern.pattern).lstrip('^')
+            if isinstance(pattern, URLResolver) and not route:
+                collect(pattern.url_patterns)
+                continue
+            segment = route.split('/', 1)[0]
+            # параметры и регулярные выражения не резервируют имён
+            if segment and not set(segment) & set('<>()[]?*+\\$'):
+                names.add(segment.lower())
+
+    collect(get_resolver().url_patterns)
+    # статику и картинки в production отдаёт веб-сервер, а не urls.py
+    for url in (settings.STATIC_URL, settings.MEDIA_URL):
+        segment = url.strip('/').split('/', 1)[0]
+        if segment:
+            names.add(segment.lower())
+    return frozenset(names)
+
+
+def is_reserved(username):
+    return username.lower() in reserved_usernames()
+
+
+@register(Tags.database)
+def check_reserved_usernames(app_configs, **kwargs):
+    # проверка данных: manage.py check --database default
+    User = get_user_model()
+    taken = [username for username in User.objects.filter(
+        username__in=reserved_usernames()).values_list('username', flat=True)]
+    return [
+        Warning(
+            f'Пользователь {username} занимает имя адреса сайта: его '
+            f'профиль /{username}/ недоступен',
+            hint='Переименуйте пользователя',
+            id='users.W001',
+        )
+        for username in taken
+    ]
@@ -1,5 +1,8 @@
 from django.test import Client, TestCase
 from django.contrib.auth import get_user_model
+from django.core.checks import run_checks
+
+from .reserved import reserved_usernames
 
 User = get_user_model()
 
@@ -25,3 +28,29 @@ class TestProfile(TestCase):
         self.client.force_login(user=self.user)
         response = self.client.get("/TestUser", follow=True)
         self.assertEqual(response.status_code, 200)
+
+
+class TestReservedUsernames(TestCase):
+    def test_site_routes_are_reserved(self):
+        reserved = reserved_usernames()
+        for name in ('search', 'export', 'trending', 'metrics', 'api',
+                     'media', 'static'):
+            self.assertIn(name, reserved)
+        self.assertNotIn('TestUser'.lower(), reserved)
+
+    def test_signup_rejects_reserved(self):
+        response = Client().post('/auth/signup/', {
+            'username': 'Search',
+            'password1': 'Strong-pass-123',
+            'password2': 'Strong-pass-123',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(User.objects.filter(username='Search').exists())
+        self.assertIn('username', response.context['form'].errors)
+
+    def test_check_finds_existing_users(self):
+        User.objects.create_user(username='export')
+        messages = run_checks(include_deployment_checks=False,
+                              tags=['database'])
+        self.assertEqual([message.id for message in messages],
+                         ['users.W001'])
@@ -0,0 +1,285 @@
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.utils.module_loading import import_string
+
+EPOCH_KEY = 'yatube:cache:epoch'
+_MISSING = object()
+
+
+class LockedFileBasedCache(FileBasedCache):
+    """
+    FileBasedCache, у которого add() и incr() атомарны между процессами
+    одной машины. В Django add() – это has_key() и set(), incr() – get() и
+    set(), поэтому два воркера могут оба "взять" одну блокировку или
+    потерять прибавку счётчика; кроме того, set() внутри incr() заново
+    ставит срок хранения по умолчанию. Здесь все изменения ключа идут под
+    блокировкой файла (одного из 256 по первым символам имени), а incr()
+    сохраняет прежний срок.
+    """
+
+    def _lock_file(self, fname):
+        directory = os.path.join(self._dir, 'locks')
+        os.makedirs(directory, 0o700, exist_ok=True)
+        return os.path.join(directory,
+                            os.path.basename(fname)[:2] + '.lock')
+
+    @contextmanager
+    def _locked(self, fname):
+        with open(self._lock_file(fname), 'ab') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock)
+
+    def _read(self, fname):
+        # (срок, значение) живого ключа или (None, _MISSING)
+        try:
+            with open(fname, 'rb') as f:
+                expiry = pickle.load(f)
+                if expiry is None or expiry >= time.time():
+                    return expiry, pickle.loads(zlib.decompress(f.read()))
+        except (FileNotFoundError, EOFError):
+            pass
+        return None, _MISSING
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            if self._read(fname)[1] is not _MISSING:
+                return False
+            super().set(key, value, timeout, version)
+            return True
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(self._key_to_file(key, version)):
+            super().set(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        # decr() в BaseCache – это incr(key, -delta)
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            expiry, value = self._read(fname)
+            if value is _MISSING:
+                raise ValueError("Key '%s' not found" % key)
+            value += delta
+            timeout = None
+            if expiry is not None:
+                timeout = max(expiry - time.time(), 0.001)
+            super().set(key, value, timeout, version)
+            return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(self._key_to_file(key, version)):
+            return super().touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            self._delete(fname)
+
+
+class TwoTierCache(BaseCache):
+    """
+    Небольшой LRU в памяти процесса перед общим для всех воркеров
+    хранилищем (по умолчанию LockedFileBasedCache в LOCATION).
+
+    Локальная копия живёт не дольше LOCAL_TIMEOUT секунд. delete(),
+    clear() и incr() в любом процессе сдвигают эпоху в общем хранилище,
+    остальные процессы сверяются с ней раз в INVALIDATION_INTERVAL секунд
+    и сбрасывают свой LRU. Ключи с префиксами из SHARED_ONLY_PREFIXES
+    (версии страниц, блокировки) в LRU не попадают вовсе.
+
+    add() и incr() атомарны ровно настолько, насколько атомарно общее
+    хранилище: LockedFileBasedCache, memcached и redis – да, обычный
+    FileBasedCache – нет (блокировки страниц и счётчики лимитов в нём
+    только приблизительны).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        shared = dict(options.get('SHARED', {}))
+        for name in ('TIMEOUT', 'KEY_PREFIX', 'VERSION', 'KEY_FUNCTION'):
+            if name in params:
+                shared.setdefault(name, params[name])
+        backend = import_string(shared.pop(
+            'BACKEND', 'yatube.cache_backends.LockedFileBasedCache'))
+        self.shared = backend(shared.pop('LOCATION', location), shared)
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.invalidation_interval = options.get('INVALIDATION_INTERVAL', 1)
+        self.shared_only = tuple(options.get('SHARED_ONLY_PREFIXES', ()))
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = _MISSING
+        self._checked = 0
+        self._stats = {'local': 0, 'shared': 0, 'miss': 0}
+
+    # локальный уровень
+
+    def _is_local(self, key):
+        return not key.startswith(self.shared_only)
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires <= time.time():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+        return pickle.loads(value)
+
+    def _local_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        expires = time.time() + self.local_timeout
+        backend_timeout = self.get_backend_timeout(timeout)
+        if backend_timeout is not None:
+            expires = min(expires, backend_timeout)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = (expires, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def _count(self, tier, count=1):
+        with self._lock:
+            self._stats[tier] += count
+
+    # межпроцессная инвалидация
+
+    def _check_epoch(self):
+        now = time.monotonic()
+        if now - self._checked < self.invalidation_interval:
+            return
+        self._checked = now
+        epoch = self.shared.get(EPOCH_KEY)
+        if epoch != self._epoch:
+            with self._lock:
+                self._local.clear()
+            self._epoch = epoch
+
+    def _bump_epoch(self):
+        self._epoch = time.time_ns()
+        self.shared.set(EPOCH_KEY, self._epoch, None)
+        self._checked = time.monotonic()
+
+    # API кэша Django
+
+    def get(self, key, default=None, version=None):
+        if not self._is_local(key):
+            return self.shared.get(key, default, version)
+        self._check_epoch()
+        local_key = self.make_key(key, version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self._count('local')
+            return value
+        value = self.shared.get(key, _MISSING, version)
+        if value is _MISSING:
+            self._count('miss')
+            return default
+        self._count('shared')
+        self._local_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._check_epoch()
+        found = {}
+        remote = []
+        for key in keys:
+            value = _MISSING
+            if self._is_local(key):
+                value = self._local_get(self.make_key(key, version))
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        self._count('local', len(found))
+        if remote:
+            shared = self.shared.get_many(remote, version)
+            for key, value in shared.items():
+                if self._is_local(key):
+                    self._local_set(self.make_key(key, version), value)
+            found.update(shared)
+            self._count('shared', len(shared))
+            self._count('miss', len(remote) - len(shared))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        if self._is_local(key):
+            self._local_set(self.make_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if self._is_local(key) and key not in failed:
+                self._local_set(self.make_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # атомарно, только если атомарен add() общего хранилища
+        added = self.shared.add(key, value, timeout, version)
+        if added and self._is_local(key):
+            self._local_set(self.make_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version)
+        if self._is_local(key):
+            self._local_delete(self.make_key(key, version))
+            self._bump_epoch()
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version)
+        local = [key for key in keys if self._is_local(key)]
+        if local:
+            self._local_delete(*(self.make_key(key, version)
+                                 for key in local))
+            self._bump_epoch()
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version) is not _MISSING
+
+    def incr(self, key, delta=1, version=None):
+        # атомарность и срок хранения – как у incr() общего хранилища
+        value = self.shared.incr(key, delta, version)
+        if self._is_local(key):
+            self._local_delete(self.make_key(key, version))
+            self._bump_epoch()
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        with self._lock:
+            self._local.clear()
+        self._bump_epoch()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, local_entries=len(self._local))
@@ -0,0 +1,75 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в DATABASE_REPLICAS. Реплики используются только
+внутри HTTP-запроса: в командах и фоновых потоках всё идёт в основную
+базу. После первой записи запрос дочитывает из основной базы, а ответ
+ставит cookie, по которой следующие REPLICA_PIN_SECONDS секунд запросы
+этого браузера тоже читают из основной базы. Так автор сразу видит свой
+пост, даже пока реплика отстаёт.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_state = threading.local()
+
+
+def _pinned():
+    # вне запроса (manage.py, потоки миниатюр) реплик нет
+    return getattr(_state, 'pinned', True)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _pinned():
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = True
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # на репликах те же данные, что и в основной базе
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # реплики получают схему репликацией
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PrimaryPinMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.pinned = self.pin_active(request)
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote and settings.DATABASE_REPLICAS:
+                seconds = settings.REPLICA_PIN_SECONDS
+                response.set_cookie(settings.REPLICA_PIN_COOKIE,
+                                    str(int(time.time() + seconds)),
+                                    max_age=seconds, httponly=True,
+                                    samesite='Lax')
+        finally:
+            del _state.pinned, _state.wrote
+        return response
+
+    @staticmethod
+    def pin_active(request):
+        try:
+            until = int(request.COOKIES.get(settings.REPLICA_PIN_COOKIE, 0))
+        except ValueError:
+            return False
+        return until > time.time()
@@ -0,0 +1,381 @@
+"""
+Метрики запросов: число и время SQL, время шаблонов, попадания в кэш –
+по имени URL. Счётчики копятся в памяти процесса, их снимки собираются
+из общего кэша и отдаются в текстовом формате Prometheus (view metrics),
+запросы дороже бюджета пишутся в лог вместе с отпечатками SQL.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates
+from django.utils.crypto import constant_time_compare
+
+from .ratelimit import client_ip, from_trusted_proxy
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+COUNTERS = ('requests', 'sql_seconds', 'template_seconds', 'cache',
+            'over_budget')
+HISTOGRAMS = ('durations', 'queries')
+
+
+class Registry:
+    """
+    Счётчики одного процесса. Раз в METRICS_FLUSH_INTERVAL секунд процесс
+    кладёт их снимок в общий кэш METRICS_CACHE под своим номером, а view
+    metrics складывает снимки всех процессов: воркеры gunicorn не делят
+    память, и иначе каждый ответ показывал бы один случайный воркер.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pid, self.owner = os.getpid(), uuid.uuid4().hex
+        self.slot = None
+        self.flushed = 0
+        self.reset()
+
+    def reset(self):
+        self.requests = defaultdict(int)
+        self.durations = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.sql_seconds = defaultdict(float)
+        self.template_seconds = defaultdict(float)
+        self.cache = defaultdict(int)
+        self.over_budget = defaultdict(int)
+
+    def record(self, view, status, elapsed, stats, over_budget):
+        with self.lock:
+            self.requests[view, str(status)] += 1
+            self.durations[view].observe(elapsed)
+            self.queries[view].observe(stats.queries)
+            self.sql_seconds[view] += stats.sql_time
+            self.template_seconds[view] += stats.template_time
+            for (name, result), count in stats.cache.items():
+                self.cache[view, name, result] += count
+            if over_budget:
+                self.over_budget[view] += 1
+
+    def snapshot(self):
+        with self.lock:
+            data = {name: dict(getattr(self, name)) for name in COUNTERS}
+            for name in HISTOGRAMS:
+                data[name] = {view: (list(values.counts), values.sum)
+                              for view, values in getattr(self, name).items()}
+        data['cache_tiers'] = {}
+        for alias in settings.CACHES:
+            tiers = getattr(caches[alias], 'stats', None)
+            if tiers is not None:
+                data['cache_tiers'][alias] = tiers()
+        return data
+
+    def flush(self, force=False):
+        """Кладёт снимок в общий кэш, если с прошлого раза прошёл интервал."""
+        now = time.monotonic()
+        if not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed = now
+        # снимок и так свежий, если его сейчас кладёт другой поток
+        if not self.flush_lock.acquire(blocking=force):
+            return
+        try:
+            self._flush()
+        finally:
+            self.flush_lock.release()
+
+    def _flush(self):
+        cache = caches[settings.METRICS_CACHE]
+        if self.pid != os.getpid():
+            # после fork() счётчики и номер достались от родителя
+            self.pid, self.owner = os.getpid(), uuid.uuid4().hex
+            self.slot = None
+            self.reset()
+        if self.slot is not None:
+            # номер мог пропасть при очистке кэша и уйти другому процессу
+            known = cache.get(SLOT_KEY.format(self.slot))
+            if known is None or known['owner'] != self.owner:
+                self.slot = None
+        if self.slot is None:
+            cache.add(SLOTS_KEY, 0, None)
+            self.slot = cache.incr(SLOTS_KEY)
+        snapshot = self.snapshot()
+        snapshot['owner'] = self.owner
+        cache.set(SLOT_KEY.format(self.slot), snapshot,
+                  settings.METRICS_PROCESS_TIMEOUT)
+
+    def collect(self):
+        """Сумма снимков всех процессов, свой – самый свежий."""
+        self.flush(force=True)
+        cache = caches[settings.METRICS_CACHE]
+        slots = cache.get(SLOTS_KEY) or 0
+        snapshots = cache.get_many(
+            [SLOT_KEY.format(slot) for slot in range(1, slots + 1)])
+        return merge(snapshots.values())
+
+    def render(self):
+        return render(self.collect())
+
+
+# номера процессов и их снимки; снимок умершего воркера хранится ещё
+# METRICS_PROCESS_TIMEOUT секунд, чтобы счётчики не откатывались назад
+SLOTS_KEY = 'metrics:processes'
+SLOT_KEY = 'metrics:process:{}'
+
+
+def merge(snapshots):
+    total = {name: defaultdict(int) for name in COUNTERS}
+    total.update({name: {} for name in HISTOGRAMS})
+    total['cache_tiers'] = {}
+    for snapshot in snapshots:
+        for name in COUNTERS:
+            for key, value in snapshot[name].items():
+                total[name][key] += value
+        for name in HISTOGRAMS:
+            for view, (counts, value_sum) in snapshot[name].items():
+                known = total[name].setdefault(view, ([0] * len(counts), 0))
+                total[name][view] = (
+                    [a + b for a, b in zip(known[0], counts)],
+                    known[1] + value_sum)
+        for alias, tiers in snapshot['cache_tiers'].items():
+            known = total['cache_tiers'].setdefault(alias, defaultdict(int))
+            for tier, count in tiers.items():
+                known[tier] += count
+    return total
+
+
+def render(data):
+    """Текстовый формат Prometheus для результата merge()."""
+    lines = []
+
+    def header(name, kind, text):
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    def sample(name, labels, value):
+        labels = ','.join(f'{key}="{label}"' for key, label in labels)
+        lines.append(f'{name}{{{labels}}} {value}')
+
+    def histogram(name, buckets, histograms):
+        for view, (counts, value_sum) in sorted(histograms.items()):
+            total = 0
+            for bucket, count in zip(buckets + ('+Inf',), counts):
+                total += count
+                sample(f'{name}_bucket', [('view', view), ('le', bucket)],
+                       total)
+            sample(f'{name}_sum', [('view', view)], value_sum)
+            sample(f'{name}_count', [('view', view)], total)
+
+    header('yatube_requests_total', 'counter', 'Обработано запросов')
+    for (view, status), count in sorted(data['requests'].items()):
+        sample('yatube_requests_total',
+               [('view', view), ('status', status)], count)
+    header('yatube_request_duration_seconds', 'histogram', 'Время ответа')
+    histogram('yatube_request_duration_seconds', DURATION_BUCKETS,
+              data['durations'])
+    header('yatube_sql_queries', 'histogram', 'SQL-запросов на один запрос')
+    histogram('yatube_sql_queries', QUERY_BUCKETS, data['queries'])
+    for name, text, values in (
+            ('yatube_sql_seconds_total', 'Время в SQL',
+             data['sql_seconds']),
+            ('yatube_template_seconds_total', 'Время в шаблонах',
+             data['template_seconds']),
+            ('yatube_over_budget_total', 'Запросов сверх бюджета',
+             data['over_budget'])):
+        header(name, 'counter', text)
+        for view, value in sorted(values.items()):
+            sample(name, [('view', view)], value)
+    header('yatube_cache_requests_total', 'counter',
+           'Обращения к кэшу страниц и карточек')
+    for (view, name, result), count in sorted(data['cache'].items()):
+        sample('yatube_cache_requests_total',
+               [('view', view), ('cache', name), ('result', result)], count)
+    header('yatube_cache_tier_total', 'counter',
+           'Обращения к уровням кэша (yatube.cache_backends)')
+    for alias, tiers in sorted(data['cache_tiers'].items()):
+        for tier in ('local', 'shared', 'miss'):
+            sample('yatube_cache_tier_total',
+                   [('alias', alias), ('tier', tier)], tiers[tier])
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache = defaultdict(int)
+        # текст SQL (с %s вместо значений) -> [число, время]
+        self.statements = {}
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += elapsed
+            statement = self.statements.setdefault(sql, [0, 0.0])
+            statement[0] += 1
+            statement[1] += elapsed
+
+
+def current():
+    return getattr(_local, 'stats', None)
+
+
+def record_cache(name, hits, misses=0):
+    """Учитывает обращения к кэшу name в метриках текущего запроса."""
+    stats = current()
+    if stats is not None:
+        if hits:
+            stats.cache[name, 'hit'] += hits
+        if misses:
+            stats.cache[name, 'miss'] += misses
+
+
+_NUMBERS = re.compile(r'\b\d+\b')
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+
+def fingerprint(sql):
+    # одинаковые запросы с разными значениями и длиной IN (...) совпадают
+    sql = _STRINGS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    return _LISTS.sub('(...)', sql)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return 'unmatched'
+    return match.url_name
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _local.stats = RequestStats()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(stats.execute))
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        elapsed = time.perf_counter() - started
+        view = _view_name(request)
+        over_budget = (elapsed * 1000 > settings.METRICS_BUDGET_MS
+                       or stats.queries > settings.METRICS_QUERY_BUDGET)
+        registry.record(view, response.status_code, elapsed, stats,
+                        over_budget)
+        registry.flush()
+        if over_budget:
+            self.log(request, view, elapsed, stats)
+        return response
+
+    @staticmethod
+    def log(request, view, elapsed, stats):
+        statements = defaultdict(lambda: [0, 0.0])
+        for sql, (count, total) in stats.statements.items():
+            statement = statements[fingerprint(sql)]
+            statement[0] += count
+            statement[1] += total
+        top = sorted(statements.items(), key=lambda item: -item[1][1])[:5]
+        logger.warning(
+            'Запрос сверх бюджета: %s %s (%s) – %.0f мс, SQL: %d за %.0f мс, '
+            'шаблоны: %.0f мс\n%s',
+            request.method, request.get_full_path(), view, elapsed * 1000,
+            stats.queries, stats.sql_time * 1000, stats.template_time * 1000,
+            '\n'.join(f'  {count}× {total * 1000:.1f} мс  {sql}'
+                      for sql, (count, total) in top),
+        )
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = current()
+        if stats is None:
+            return self.template.render(context, request)
+        # вложенные render_to_string (карточки постов) уже внутри внешнего
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django с учётом времени отрисовки в метриках запроса."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+def _allowed(request):
+    if settings.METRICS_TOKEN:
+        return constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''),
+            f'Bearer {settings.METRICS_TOKEN}')
+    # без токена – только с METRICS_ALLOWED_IPS; запрос через прокси, не
+    # указанный в TRUSTED_PROXIES, пришёл бы с его локального адреса
+    if ('HTTP_X_FORWARDED_FOR' in request.META
+            and not from_trusted_proxy(request)):
+        return False
+    return client_ip(request) in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
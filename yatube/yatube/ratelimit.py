@@ -0,0 +1,173 @@
+"""
+Ограничение частоты запросов: корзины токенов на пользователя и на IP,
+отдельно для каждого имени URL (RATELIMITS). Запрос сверх лимита получает
+429 с Retry-After.
+
+Корзина хранится в кэше RATELIMIT_CACHE одним числом – моментом, когда
+она снова станет полной (GCRA): incr() забирает токен, add() заводит
+новую корзину. От кэша нужны атомарные add() и incr(), причём incr() не
+должен трогать срок хранения ключа. Так работают memcached, redis и
+LockedFileBasedCache из yatube.cache_backends. У FileBasedCache из
+Django incr() – это get() и set(): параллельные запросы теряют токены, а
+срок хранения сбрасывается на TIMEOUT по умолчанию (300 с), и корзина с
+часовым лимитом пропадает через пять минут – лимит просто обнуляется.
+Ключи с префиксом ratelimit: должны быть в SHARED_ONLY_PREFIXES у
+yatube.cache_backends.TwoTierCache. Срок хранения продлевается на период
+лимита при каждом выданном токене: корзина не пропадает, пока она пуста.
+
+За обратным прокси REMOTE_ADDR – адрес прокси, поэтому адрес клиента
+берётся из X-Forwarded-For, если запрос пришёл от TRUSTED_PROXIES.
+"""
+import ipaddress
+import math
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+
+KEY = 'ratelimit:{}:{}:{}'
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+DEFAULT_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'10/m' -> (10, 60): корзина на 10 запросов, полностью за минуту."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period]
+
+
+def take(key, rate, now=None):
+    """
+    Забирает токен из корзины key. Возвращает 0, если запрос проходит,
+    иначе – сколько секунд ждать следующего токена.
+    """
+    burst, period = parse_rate(rate)
+    # миллисекунды на один токен
+    interval = max(period * 1000 // burst, 1)
+    now = int((now or time.time()) * 1000)
+    cache = caches[settings.RATELIMIT_CACHE]
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        # корзины ещё нет (или истекла): заводим полную без одного токена
+        if cache.add(key, now + interval, period + 1):
+            return 0
+        full_at = cache.incr(key, interval)
+    if full_at <= now + interval:
+        # корзина успела наполниться: отсчёт заново от текущего момента
+        cache.set(key, now + interval, period + 1)
+        return 0
+    if full_at - now <= burst * interval:
+        # incr() срок не продлевает, а после этого токена корзина
+        # наполнится не позже чем через период
+        cache.touch(key, period + 1)
+        return 0
+    # отказ токен не тратит
+    cache.decr(key, interval)
+    return (full_at - now - burst * interval) / 1000
+
+
+def _trusted(address, networks):
+    try:
+        address = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def _proxy_networks():
+    return [ipaddress.ip_network(network)
+            for network in settings.TRUSTED_PROXIES]
+
+
+def from_trusted_proxy(request):
+    """Пришёл ли запрос от одного из TRUSTED_PROXIES."""
+    return _trusted(request.META.get('REMOTE_ADDR', ''), _proxy_networks())
+
+
+def client_ip(request):
+    """
+    Адрес клиента. Если запрос пришёл от доверенного прокси, адреса из
+    X-Forwarded-For разбираются справа налево: первый не из TRUSTED_PROXIES
+    и есть клиент (левее него значения подставляет сам клиент).
+    """
+    remote = request.META.get('REMOTE_ADDR', '')
+    networks = _proxy_networks()
+    if not _trusted(remote, networks):
+        return remote
+    forwarded = [address.strip() for address in
+                 request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+                 if address.strip()]
+    for address in reversed(forwarded):
+        if not _trusted(address, networks):
+            return address
+    # вся цепочка из доверенных прокси
+    return forwarded[0] if forwarded else remote
+
+
+def check(request, scope, limits):
+    """Ответ 429, если запрос не укладывается в limits, иначе None."""
+    if request.method not in limits.get('methods', DEFAULT_METHODS):
+        return None
+    buckets = []
+    if limits.get('user') and request.user.is_authenticated:
+        buckets.append(('user', request.user.pk, limits['user']))
+    if limits.get('ip'):
+        buckets.append(('ip', client_ip(request), limits['ip']))
+    wait = 0
+    for kind, ident, rate in buckets:
+        wait = max(wait, take(KEY.format(scope, kind, ident), rate))
+    if wait:
+        return too_many_requests(request, wait)
+    return None
+
+
+def too_many_requests(request, wait):
+    if request.is_ajax() or request.path.startswith('/api/'):
+        response = JsonResponse(
+            {'detail': 'Слишком много запросов, повторите позже'},
+            status=429)
+    else:
+        response = HttpResponse(
+            render_to_string('misc/429.html', request=request), status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def ratelimit(scope=None, **limits):
+    """
+    Декоратор для view с собственными лимитами:
+    @ratelimit(user='10/m', ip='30/m', methods=['POST']).
+    """
+    def decorator(view):
+        name = scope or f'{view.__module__}.{view.__name__}'
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = check(request, name, limits)
+            if response is not None:
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RateLimitMiddleware:
+    """Лимиты из RATELIMITS по имени URL; после AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        limits = settings.RATELIMITS.get(match.url_name) if match else None
+        if limits is None:
+            return None
+        return check(request, match.url_name, limits)
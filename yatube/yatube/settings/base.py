@@ -0,0 +1,281 @@
+"""
+Django settings for yatube project: общие для всех профилей. Профили –
+yatube.settings.development (manage.py) и yatube.settings.production
+(yatube/wsgi.py).
+
+Generated by 'django-admin startproject' using Django 2.2.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/2.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/2.2/ref/settings/
+"""
+
+import os
+import tempfile
+
+# Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = '1vf0c4*23rot18f)$!4uxklx-w#ztao%n8ewj%-v!j^o@9#7b2'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = [
+    "localhost",
+    "127.0.0.1",
+    "[::1]",
+    "testserver",
+]
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'posts',
+    'users',
+    'django.contrib.sites',
+    'django.contrib.flatpages',
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'sorl.thumbnail',
+]
+
+MIDDLEWARE = [
+    'yatube.metrics.MetricsMiddleware',
+    'yatube.db_router.PrimaryPinMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yatube.ratelimit.RateLimitMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'yatube.urls'
+
+TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
+TEMPLATES = [
+    {
+        'BACKEND': 'yatube.metrics.TimedDjangoTemplates',
+        'DIRS': [TEMPLATES_DIR],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'yatube.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    }
+}
+
+# Реплики только для чтения (yatube.db_router). Для проверки на локальной
+# машине достаточно копии db.sqlite3: YATUBE_REPLICA_DB=путь/к/копии
+if os.environ.get('YATUBE_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['YATUBE_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['yatube.db_router.PrimaryReplicaRouter']
+# после записи браузер столько секунд читает из основной базы
+REPLICA_PIN_SECONDS = 15
+REPLICA_PIN_COOKIE = 'primary_pin'
+
+
+# Password validation
+# https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/2.2/topics/i18n/
+
+LANGUAGE_CODE = 'ru'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_L10N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/2.2/howto/static-files/
+
+STATIC_URL = '/static/'
+
+# задаём адрес директории, куда командой *collectstatic* будет собрана вся статика
+STATIC_ROOT = os.path.join(BASE_DIR, "static")
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Login
+
+LOGIN_URL = "/auth/login/"
+LOGIN_REDIRECT_URL = "index"
+LOGOUT_REDIRECT_URL = "index"
+
+#  подключаем движок filebased.EmailBackend
+EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+# указываем директорию, в которую будут складываться файлы писем
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
+
+# Идентификатор текущего сайта
+SITE_ID = 1
+
+# Общий для всех воркеров кэш в файлах и небольшой LRU в каждом процессе
+# перед ним (yatube.cache_backends). Версии страниц и блокировки читаются
+# только из общего уровня, чтобы сброс был виден всем процессам сразу
+CACHES = {
+    'default': {
+        'BACKEND': 'yatube.cache_backends.TwoTierCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'yatube-cache'),
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'INVALIDATION_INTERVAL': 1,
+            'SHARED_ONLY_PREFIXES': ['posts:version:', 'posts:lock:',
+                                     'ratelimit:', 'metrics:'],
+            # add() и incr() под блокировкой файла: на них держатся
+            # блокировки перестройки страниц и счётчики лимитов запросов
+            'SHARED': {
+                'BACKEND': 'yatube.cache_backends.LockedFileBasedCache',
+                'OPTIONS': {'MAX_ENTRIES': 10000},
+            },
+        },
+    }
+}
+
+# Лента подписок: посты авторов, у которых не больше стольких подписчиков,
+# раскладываются по лентам при публикации; у остальных – читаются на лету
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BATCH_SIZE = 500
+
+# Страницы лент хранятся в кэше до изменения данных (см. posts.cache)
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+POSTS_PAGE_LOCK_TIMEOUT = 10
+# Отрисованные карточки постов (ключ меняется вместе с содержимым)
+POSTS_CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Картинки постов: исходник ужимается до POSTS_IMAGE_MAX_SIZE по большей
+# стороне, для карточки готовятся варианты под srcset (JPEG и, если Pillow
+# умеет, WebP) сразу после загрузки
+POSTS_IMAGE_MAX_SIZE = 2048
+POSTS_IMAGE_QUALITY = 85
+POSTS_CARD_IMAGE_SIZES = ['480x170', '960x339', '1920x678']
+POSTS_CARD_IMAGE_BASE = 1
+POSTS_CARD_IMAGE_OPTIONS = {'crop': 'center', 'upscale': True}
+POSTS_THUMBNAIL_WORKERS = 2
+
+# Полнотекстовый поиск по постам (FTS5 в SQLite, tsvector в PostgreSQL)
+POSTS_SEARCH_PER_PAGE = 10
+POSTS_SEARCH_MAX_PAGES = 50
+
+# JSON API (posts.api)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Выгрузка данных пользователя (posts.export): строк за один запрос к базе
+EXPORT_CHUNK_SIZE = 500
+
+# Метрики запросов (yatube.metrics): запросы дольше METRICS_BUDGET_MS или
+# с числом SQL больше METRICS_QUERY_BUDGET пишутся в лог
+METRICS_BUDGET_MS = 500
+METRICS_QUERY_BUDGET = 50
+# /metrics/: с заголовком Authorization: Bearer METRICS_TOKEN, а пока токен
+# не задан – только с адресов METRICS_ALLOWED_IPS
+METRICS_TOKEN = ''
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# счётчики процессов складываются через этот кэш (см. yatube.metrics)
+METRICS_CACHE = 'default'
+METRICS_FLUSH_INTERVAL = 5
+METRICS_PROCESS_TIMEOUT = 60 * 60 * 24
+
+# Холодный архив (команда archive_posts): посты старше стольких дней
+POSTS_ARCHIVE_AFTER_DAYS = 365
+POSTS_ARCHIVE_BATCH_SIZE = 500
+
+# Комментарии под постом: столько на странице, остальные подгружаются
+POSTS_COMMENTS_PER_PAGE = 20
+
+# Популярное (posts.trending): вес публикации и комментария затухает вдвое
+# за TRENDING_HALF_LIFE_HOURS; посты, чей вес упал ниже TRENDING_MIN_WEIGHT,
+# команда compact_trending убирает из таблицы рейтинга
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_POST_WEIGHT = 2
+TRENDING_COMMENT_WEIGHT = 1
+TRENDING_MIN_WEIGHT = 0.01
+TRENDING_SIZE = 20
+
+# Прогрев процесса до первого запроса (yatube.warmup): шаблоны, URL,
+# соединения с базой и эти страницы в кэше
+WARMUP_ON_START = False
+WARMUP_PATHS = ['/', '/trending/']
+
+# Ограничение частоты запросов (yatube.ratelimit): по имени URL – корзины
+# на пользователя и на IP в виде «запросов/период» (s, m, h, d); по
+# умолчанию считаются только POST, PUT, PATCH и DELETE
+RATELIMIT_CACHE = 'default'
+# адреса и сети обратных прокси: от них адрес клиента берётся из
+# X-Forwarded-For (yatube.ratelimit.client_ip)
+TRUSTED_PROXIES = []
+RATELIMITS = {
+    'new_post': {'user': '30/h', 'ip': '100/h'},
+    'add_comment': {'user': '20/m', 'ip': '60/m'},
+    # подписка работает и по обычной ссылке
+    'profile_follow': {'user': '60/m', 'ip': '120/m',
+                       'methods': ['GET', 'POST']},
+    'profile_unfollow': {'user': '60/m', 'ip': '120/m',
+                         'methods': ['GET', 'POST']},
+    'signup': {'ip': '10/h'},
+    'login': {'ip': '30/m'},
+}
@@ -0,0 +1,13 @@
+from .base import *  # noqa
+
+DEBUG = True
+
+# новые списки, а не += : base.py остаётся нетронутым для других профилей
+INSTALLED_APPS = INSTALLED_APPS + ['debug_toolbar']  # noqa: F405
+MIDDLEWARE = MIDDLEWARE + [  # noqa: F405
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+]
+
+INTERNAL_IPS = [
+    '127.0.0.1',
+]
@@ -0,0 +1,46 @@
+import copy
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa
+
+DEBUG = False
+
+try:
+    SECRET_KEY = os.environ['YATUBE_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured('Не задан YATUBE_SECRET_KEY')
+
+ALLOWED_HOSTS = os.environ.get('YATUBE_ALLOWED_HOSTS',
+                               'localhost').split(',')
+
+# например, 127.0.0.1,10.0.0.0/8 – адреса nginx перед приложением
+TRUSTED_PROXIES = [proxy for proxy in
+                   os.environ.get('YATUBE_TRUSTED_PROXIES', '').split(',')
+                   if proxy]
+
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+
+# вложенные словари base.py меняются только в копиях
+DATABASES = copy.deepcopy(DATABASES)  # noqa: F405
+TEMPLATES = copy.deepcopy(TEMPLATES)  # noqa: F405
+
+# соединение с базой переживает запрос и переиспользуется воркером
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = int(os.environ.get('YATUBE_CONN_MAX_AGE',
+                                                  600))
+
+# шаблоны разбираются один раз на процесс; APP_DIRS с явными loaders
+# несовместим, поэтому каталоги приложений подключены загрузчиком
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+TEMPLATES[0]['OPTIONS']['context_processors'].remove(
+    'django.template.context_processors.debug')
+
+WARMUP_ON_START = True
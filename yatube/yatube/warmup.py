@@ -0,0 +1,149 @@
+"""
+Прогрев процесса до первого запроса: всё, что иначе досталось бы первым
+посетителям нового воркера, – разбор шаблонов, компиляция URL,
+соединение с базой, страницы из WARMUP_PATHS в кэше. yatube/wsgi.py
+вызывает run() при WARMUP_ON_START, команда warmup – по требованию и для
+замера холодного старта.
+"""
+import io
+import logging
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.utils import get_app_template_dirs
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_EXTENSIONS = ('.html', '.txt', '.xml')
+
+
+def _template_names(backend):
+    names = set()
+    dirs = list(backend.engine.dirs) + list(get_app_template_dirs('templates'))
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(TEMPLATE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    names.add(os.path.relpath(path, directory)
+                              .replace(os.sep, '/'))
+    return sorted(names)
+
+
+def compile_templates():
+    # с cached.Loader разобранные шаблоны остаются в памяти процесса;
+    # без него (DEBUG) это только проверка, что все шаблоны собираются
+    compiled = failed = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for name in _template_names(backend):
+            try:
+                backend.get_template(name)
+                compiled += 1
+            except (TemplateDoesNotExist, TemplateSyntaxError) as error:
+                failed += 1
+                logger.debug('Шаблон %s не собрался: %s', name, error)
+    return f'{compiled} шаблонов, с ошибками – {failed}'
+
+
+def resolve_urls():
+    resolver = get_resolver()
+    # заполняет таблицы reverse и компилирует регулярные выражения
+    # всех вложенных include()
+    resolver.reverse_dict
+
+    def count(patterns):
+        total = 0
+        for pattern in patterns:
+            pattern.pattern.regex
+            if isinstance(pattern, URLResolver):
+                total += count(pattern.url_patterns)
+            else:
+                total += 1
+        return total
+
+    return f'{count(resolver.url_patterns)} адресов'
+
+
+def connect_databases():
+    for connection in connections.all():
+        connection.ensure_connection()
+    return ', '.join(connections)
+
+
+def get_page(application, path, host):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'HTTP_HOST': host,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    status = []
+    started = time.perf_counter()
+    result = application(environ, lambda code, headers: status.append(code))
+    try:
+        for _ in result:
+            pass
+    finally:
+        result.close()
+    return int(status[0].split()[0]), time.perf_counter() - started
+
+
+def default_host():
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS
+             if host != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def request_pages(application=None):
+    # анонимные страницы через всё приложение с middleware: кэш страниц и
+    # карточек, миниатюры в sorl, сессии и шаблоны, которые они тянут
+    if application is None:
+        from django.core.handlers.wsgi import WSGIHandler
+        application = WSGIHandler()
+    host = default_host()
+    pages = []
+    for path in settings.WARMUP_PATHS:
+        status, elapsed = get_page(application, path, host)
+        pages.append(f'{path} {status} {elapsed * 1000:.0f} мс')
+    return '; '.join(pages)
+
+
+def run(application=None):
+    """Выполняет все шаги прогрева. Возвращает [(шаг, секунды, итог)]."""
+    steps = (
+        ('urls', resolve_urls),
+        ('templates', compile_templates),
+        ('databases', connect_databases),
+        ('pages', lambda: request_pages(application)),
+    )
+    report = []
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            detail = step()
+        except Exception as error:
+            # прогрев – оптимизация: воркер должен подняться и без него
+            logger.exception('Прогрев: шаг %s не удался', name)
+            detail = f'ошибка: {error}'
+        report.append((name, time.perf_counter() - started, detail))
+    total = sum(seconds for _, seconds, _ in report)
+    logger.info('Прогрев за %.0f мс: %s', total * 1000, '; '.join(
+        f'{name} {seconds * 1000:.0f} мс' for name, seconds, _ in report))
+    return report
@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
+from django.db import connections
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings.production')
 
 application = get_wsgi_application()
+
+if settings.WARMUP_ON_START:
+    from yatube import warmup
+
+    warmup.run(application)
+    # при gunicorn --preload модуль загружается в мастере до fork:
+    # воркеры не должны делить его сокеты, каждый откроет свои
+    connections.close_all()